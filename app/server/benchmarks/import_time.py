@@ -0,0 +1,121 @@
+"""
+Measure how long the fireshare CLI and web app take to import and start.
+
+Runs `python -X importtime` in a fresh interpreter for each entry point and
+reports the total import time plus the modules that are slowest to import, then times
+create_app() for the CLI (web=False) and the web server. Run it from
+app/server with the same environment the app uses (DATA_DIRECTORY etc.):
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --json > import_time.json
+    python benchmarks/import_time.py --max-cli-ms 400
+
+--max-cli-ms exits non-zero when the CLI import is slower than the budget, so
+the check can run in CI and catch a heavy import creeping back into the ingest
+path.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORTS = {
+    'cli': 'import fireshare.cli',
+    'web': 'import fireshare, fireshare.api, fireshare.auth, fireshare.main',
+}
+
+STARTUP = {
+    'cli': 'from fireshare import create_app; create_app(web=False)',
+    'web': 'from fireshare import create_app; create_app()',
+}
+
+
+def _env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = SERVER_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    env.setdefault('FS_LOGLEVEL', 'ERROR')
+    if 'DATA_DIRECTORY' not in env:
+        root = tempfile.mkdtemp(prefix='fireshare-bench-')
+        for name in ('DATA_DIRECTORY', 'VIDEO_DIRECTORY', 'PROCESSED_DIRECTORY'):
+            env[name] = os.path.join(root, name.split('_')[0].lower())
+    return env
+
+
+def _parse_importtime(statement):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+        env=_env(), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    top_level, self_times = {}, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        self_times[name.strip()] = int(self_us) / 1000
+        # Nested imports are indented under the module that pulled them in
+        if not name[1:].startswith('  '):
+            top_level[name.strip()] = int(cumulative_us) / 1000
+    return top_level, self_times
+
+
+def import_time(statement):
+    """
+    Return the total import time of `statement` in ms and the modules that took
+    longest to import themselves, parsed from -X importtime output. Modules the
+    interpreter imports at startup anyway are left out.
+    """
+    baseline, _ = _parse_importtime('pass')
+    top_level, self_times = _parse_importtime(statement)
+    total = sum(ms for name, ms in top_level.items() if name not in baseline)
+    slowest = sorted(((name, ms) for name, ms in self_times.items() if name not in baseline),
+        key=lambda m: m[1], reverse=True)
+    return round(total, 1), slowest
+
+
+def startup_time(statement, runs=3):
+    code = f'import time; s = time.perf_counter(); {statement}; print((time.perf_counter() - s) * 1000)'
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', code], env=_env(), capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return round(min(timings), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--top', type=int, default=10, help='number of slowest modules to list')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--max-cli-ms', type=float, help='fail if importing the CLI takes longer than this')
+    args = parser.parse_args()
+
+    results = {}
+    for name, statement in IMPORTS.items():
+        total, modules = import_time(statement)
+        results[name] = {
+            'import_ms': total,
+            'startup_ms': startup_time(STARTUP[name]),
+            'slowest': modules[:args.top],
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, result in results.items():
+            print(f"{name}: import {result['import_ms']}ms, import + create_app {result['startup_ms']}ms, slowest modules:")
+            for module, ms in result['slowest']:
+                print(f"    {ms:>9.1f}ms  {module}")
+
+    if args.max_cli_ms is not None and results['cli']['import_ms'] > args.max_cli_ms:
+        print(f"CLI import took {results['cli']['import_ms']}ms, over the {args.max_cli_ms}ms budget", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,14 +1,11 @@
 import os, sys
 import os.path
-import ldap
 from flask import Flask, request
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from flask_login import LoginManager
-from flask_cors import CORS
 from pathlib import Path
 import logging
 import json
+import copy
 import secrets
 
 logger = logging.getLogger('fireshare')
@@ -21,7 +18,6 @@ logger.setLevel(logging.DEBUG)
 
 
 db = SQLAlchemy()
-migrate = Migrate()
 
 def update_config(path):
     logger.info("Validating configuration file...")
@@ -45,21 +41,67 @@ def update_config(path):
     if not path.exists():
         path.write_text(json.dumps(DEFAULT_CONFIG, indent=2))
 
-    with open(path, 'r+') as configfile:
+    with open(path, 'r') as configfile:
         try:
             current = json.load(configfile)
         except:
             logger.error(f"Invalid config.json file at {str(path)}, exiting...")
             sys.exit()
-        updated = combine(DEFAULT_CONFIG, current)
+    # combine() fills in the defaults in place, so work on a copy of them
+    updated = combine(copy.deepcopy(DEFAULT_CONFIG), current)
+    if updated != current:
         path.write_text(json.dumps(updated, indent=2))
-        configfile.close()
 
-def create_app(init_schedule=False):
+def _init_web(app):
+    from flask_migrate import Migrate
+    from flask_login import LoginManager
+    Migrate(app, db)
+
+    if app.config["LDAP_ENABLE"]:
+        import ldap
+        if not app.config["LDAP_URL"] or not app.config["LDAP_BINDDN"] or not app.config["LDAP_BASEDN"] or not app.config["LDAP_USER_FILTER"]:
+            app.logger.error("Missing parameters for LDAP")
+            exit(1)
+        app.ldap_conn = ldap.initialize(app.config["LDAP_URL"])
+        app.ldap_conn.protocol_version = ldap.VERSION3
+        app.ldap_conn.simple_bind_s(app.config["LDAP_BINDDN"] + "," + app.config["LDAP_BASEDN"], app.config["LDAP_PASSWORD"])
+        app.logger.info("LDAP connection successful")
+    
+    login_manager = LoginManager()
+    login_manager.init_app(app)
+
+    from .models import User
+
+    @login_manager.user_loader
+    def load_user(user_id):
+        return User.query.get(int(user_id))
+
+    
+    from .auth import auth as auth_blueprint
+    app.register_blueprint(auth_blueprint)
+
+    
+    
+    from .api import api as api_blueprint
+    app.register_blueprint(api_blueprint)
+
+    
+    from .main import main as main_blueprint
+    app.register_blueprint(main_blueprint)
+
+    if app.config['QUERY_DIAGNOSTICS']:
+        from .api.utils.diagnostics import init_query_diagnostics
+        init_query_diagnostics(app)
+
+def create_app(init_schedule=False, web=True):
+    # web=False is for the CLI and background workers: config and the database
+    # only, without importing LDAP, login, migrations, CORS or the HTTP blueprints
     app = Flask(__name__, static_url_path='', static_folder='build', template_folder='build')
     
-    # Enhanced CORS configuration with better security
-    CORS(app, supports_credentials=True)
+    if web:
+        # Enhanced CORS configuration with better security
+        from flask_cors import CORS
+        CORS(app, supports_credentials=True)
     
     # Configure security headers for HTTPS
     @app.after_request
@@ -84,6 +126,13 @@ def create_app(init_schedule=False):
     app.config['ENVIRONMENT'] = os.getenv('ENVIRONMENT')
     app.config['DOMAIN'] = os.getenv('DOMAIN')
     app.config['THUMBNAIL_VIDEO_LOCATION'] = int(os.getenv('THUMBNAIL_VIDEO_LOCATION') or 0)
+    # Files modified more recently than this are left for a later metadata sync
+    app.config['PROBE_STABLE_SECONDS'] = int(os.getenv('PROBE_STABLE_SECONDS', '30'))
+    app.config['PROBE_MAX_BACKOFF_SECONDS'] = int(os.getenv('PROBE_MAX_BACKOFF_SECONDS', '3600'))
+    # 'fast' takes the keyframe nearest the thumbnail position, 'accurate' decodes on to the exact frame
+    app.config['POSTER_SEEK_MODE'] = os.getenv('POSTER_SEEK_MODE', 'fast').lower()
+    app.config['POSTER_QUALITY'] = int(os.getenv('POSTER_QUALITY')) if os.getenv('POSTER_QUALITY') else None
+    app.config['POSTER_MAX_WIDTH'] = int(os.getenv('POSTER_MAX_WIDTH') or 0) or None
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', secrets.token_hex(32)) 
     app.config['DATA_DIRECTORY'] = os.getenv('DATA_DIRECTORY')
     app.config['VIDEO_DIRECTORY'] = os.getenv('VIDEO_DIRECTORY')
@@ -103,8 +152,41 @@ def create_app(init_schedule=False):
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{app.config["DATA_DIRECTORY"]}/db.sqlite'
     app.config['SCHEDULED_JOBS_DATABASE_URI'] = f'sqlite:///jobs.sqlite'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # SQLite tuning, see db_config. SQLITE_JOURNAL_MODE=DELETE is an escape hatch for filesystems without WAL support
+    app.config['SQLITE_JOURNAL_MODE'] = os.getenv('SQLITE_JOURNAL_MODE', 'WAL').upper()
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '15000'))
+    app.config['SQLITE_MMAP_SIZE_MB'] = int(os.getenv('SQLITE_MMAP_SIZE_MB', '256'))
+    app.config['SQLITE_CACHE_SIZE_KB'] = int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536'))
+    # How long view and job progress writes are gathered before being committed together, 0 writes each one immediately
+    app.config['DB_WRITE_FLUSH_SECONDS'] = float(os.getenv('DB_WRITE_FLUSH_SECONDS', '1'))
+    # Views are deduplicated in memory and written every VIEW_FLUSH_SECONDS or once VIEW_FLUSH_SIZE are pending
+    app.config['VIEW_FLUSH_SECONDS'] = float(os.getenv('VIEW_FLUSH_SECONDS', '5'))
+    app.config['VIEW_FLUSH_SIZE'] = int(os.getenv('VIEW_FLUSH_SIZE', '500'))
+    app.config['VIEW_BUFFER_MAX'] = int(os.getenv('VIEW_BUFFER_MAX', '50000'))
+    # 'approximate' counts unique viewers with a HyperLogLog sketch per video and keeps
+    # individual view rows for VIEW_EXACT_WINDOW_DAYS only, see `fireshare compact-views`
+    app.config['VIEW_COUNT_MODE'] = os.getenv('VIEW_COUNT_MODE', 'exact').lower()
+    app.config['VIEW_EXACT_WINDOW_DAYS'] = int(os.getenv('VIEW_EXACT_WINDOW_DAYS', '30'))
+    # Hourly view analytics are pruned after this many days, daily ones are kept
+    app.config['VIEW_HOURLY_RETENTION_DAYS'] = int(os.getenv('VIEW_HOURLY_RETENTION_DAYS', '14'))
+    # How fast views stop counting towards the 'trending' sort, see `fireshare compute-trending`
+    app.config['TRENDING_HALF_LIFE_HOURS'] = float(os.getenv('TRENDING_HALF_LIFE_HOURS', '48'))
+    # Shuffle sessions older than this are deleted when a new one is created
+    app.config['SHUFFLE_SESSION_HOURS'] = int(os.getenv('SHUFFLE_SESSION_HOURS', '24'))
+    # A claimed job goes back to the queue if its worker stops renewing the lease for this long
+    app.config['JOB_LEASE_SECONDS'] = int(os.getenv('JOB_LEASE_SECONDS', '300'))
     app.config['INIT_SCHEDULE'] = init_schedule
     app.config['MINUTES_BETWEEN_VIDEO_SCANS'] = int(os.getenv('MINUTES_BETWEEN_VIDEO_SCANS', '5'))
+    # With `fireshare watch` importing changes as they happen, the scheduled scan only reconciles
+    app.config['ENABLE_WATCH'] = os.getenv('ENABLE_WATCH', 'false').lower() == 'true'
+    app.config['WATCH_RECONCILE_MINUTES'] = int(os.getenv('WATCH_RECONCILE_MINUTES', '60'))
+    # Comma separated fnmatch patterns, matched against file and directory names or paths, that scans skip
+    app.config['SCAN_IGNORE_PATTERNS'] = [p.strip() for p in os.getenv('SCAN_IGNORE_PATTERNS', '').split(',') if p.strip()]
+    # Hand file delivery to nginx via X-Accel-Redirect instead of streaming through Python
+    app.config['ENABLE_ACCEL_REDIRECT'] = os.getenv('ENABLE_ACCEL_REDIRECT', 'false').lower() == 'true'
+    app.config['ACCEL_REDIRECT_PREFIX'] = os.getenv('ACCEL_REDIRECT_PREFIX', '/_accel')
+    # Lets signed in users add query counts and timing to listing responses with ?debug=1
+    app.config['QUERY_DIAGNOSTICS'] = os.getenv('QUERY_DIAGNOSTICS', 'false').lower() == 'true'
     app.config['WARNINGS'] = []
 
     if (app.config['ADMIN_PASSWORD'] and app.config['ADMIN_USERNAME'] == "admin") and app.config["DISABLE_ADMINCREATE"] == False:
@@ -134,45 +216,21 @@ def create_app(init_schedule=False):
     
     update_config(paths['data'] / 'config.json')
 
+    from .db_config import engine_options, init_engine, writer
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
     db.init_app(app)
-    migrate.init_app(app, db)
-
-
-    if app.config["LDAP_ENABLE"]:
-        if not app.config["LDAP_URL"] or not app.config["LDAP_BINDDN"] or not app.config["LDAP_BASEDN"] or not app.config["LDAP_USER_FILTER"]:
-            app.logger.error("Missing parameters for LDAP")
-            exit(1)
-        app.ldap_conn = ldap.initialize(app.config["LDAP_URL"])
-        app.ldap_conn.protocol_version = ldap.VERSION3
-        app.ldap_conn.simple_bind_s(app.config["LDAP_BINDDN"] + "," + app.config["LDAP_BASEDN"], app.config["LDAP_PASSWORD"])
-        app.logger.info("LDAP connection successful")
-    
-    login_manager = LoginManager()
-    login_manager.init_app(app)
-
-    from .models import User
+    init_engine(app)
+    writer.init_app(app)
+    from .view_buffer import view_buffer
+    view_buffer.init_app(app)
 
-    @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(int(user_id))
-
-    
-    from .auth import auth as auth_blueprint
-    app.register_blueprint(auth_blueprint)
-
-    
-    
-    from .api import api as api_blueprint
-    app.register_blueprint(api_blueprint)
-
-    
-    from .main import main as main_blueprint
-    app.register_blueprint(main_blueprint)
+    if web:
+        _init_web(app)
 
     if init_schedule:
         from .schedule import init_schedule
         init_schedule(app.config['SCHEDULED_JOBS_DATABASE_URI'],
-            app.config['MINUTES_BETWEEN_VIDEO_SCANS'])
+            app.config['WATCH_RECONCILE_MINUTES'] if app.config['ENABLE_WATCH'] else app.config['MINUTES_BETWEEN_VIDEO_SCANS'])
 
     with app.app_context():
         
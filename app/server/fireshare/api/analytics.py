@@ -0,0 +1,67 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required
+
+from ..models import Video
+from .utils.response_helpers import api_error
+from .utils.analytics_helpers import AnalyticsError, parse_range, view_series, top_viewed
+
+
+analytics_bp = Blueprint('analytics', __name__, url_prefix='/api/analytics')
+
+
+def series_response(*criteria):
+    
+    try:
+        model, step, start, end = parse_range(request.args)
+    except AnalyticsError as e:
+        return api_error(str(e))
+    return jsonify({
+        "interval": request.args.get('interval', 'day'),
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "series": view_series(model, step, start, end, *criteria),
+    })
+
+
+@analytics_bp.route('/videos/<video_id>', methods=['GET'])
+@login_required
+def get_video_views_series(video_id):
+    
+    return series_response(Video.video_id == video_id)
+
+
+@analytics_bp.route('/games/<int:game_id>', methods=['GET'])
+@login_required
+def get_game_views_series(game_id):
+    
+    return series_response(Video.game_id == game_id)
+
+
+@analytics_bp.route('/owners/<int:owner_id>', methods=['GET'])
+@login_required
+def get_owner_views_series(owner_id):
+    
+    return series_response(Video.owner_id == owner_id)
+
+
+@analytics_bp.route('/top', methods=['GET'])
+@login_required
+def get_top_viewed():
+    
+    try:
+        model, _, start, end = parse_range(request.args)
+        limit = int(request.args.get('limit', 10))
+        results = top_viewed(model, start, end, request.args.get('by', 'video'), limit)
+    except ValueError as e:
+        return api_error(str(e))
+    return jsonify({
+        "interval": request.args.get('interval', 'day'),
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "by": request.args.get('by', 'video'),
+        "results": results,
+    })
+
+
+def register_routes(app_or_blueprint):
+    app_or_blueprint.register_blueprint(analytics_bp)
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_login import current_user, login_required
-from sqlalchemy import select, func
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 from .. import db
 from ..models import Folder, Video
 from .utils.response_helpers import api_error, api_success
@@ -12,19 +13,15 @@ folders_bp = Blueprint('folders', __name__, url_prefix='/api/folders')
 def get_folders():
     
     
-    stmt = select(Folder).order_by(Folder.name)
+    stmt = select(Folder).options(selectinload(Folder.game)).order_by(Folder.name)
     folders = db.session.execute(stmt).scalars().all()
     
     
+    counts = Folder.video_counts()
     folders_with_count = []
     for folder in folders:
         folder_json = folder.json()
-        
-        
-        stmt = select(func.count()).select_from(Video).filter_by(folder_id=folder.id)
-        video_count = db.session.execute(stmt).scalar_one()
-        
-        folder_json["video_count"] = video_count
+        folder_json["video_count"] = counts.get(folder.id, 0)
         folders_with_count.append(folder_json)
         
     return jsonify({"folders": folders_with_count})
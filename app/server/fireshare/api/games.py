@@ -2,6 +2,7 @@ import logging
 from flask import Blueprint, request, jsonify, current_app
 from flask_login import current_user, login_required
 from sqlalchemy import select, func
+from sqlalchemy.orm import selectinload
 from .. import db
 from ..models import Game, Video
 from .utils.response_helpers import api_error, api_success
@@ -13,18 +14,15 @@ games_bp = Blueprint('games', __name__, url_prefix='/api/games')
 def get_games():
     
     
-    stmt = select(Game).order_by(Game.name)
+    stmt = select(Game).options(selectinload(Game.folder)).order_by(Game.name)
     games = db.session.execute(stmt).scalars().all()
     
     
+    counts = Game.video_counts()
     games_with_count = []
     for game in games:
         game_json = game.json()
-        
-        
-        stmt = select(func.count()).select_from(Video).filter_by(game_id=game.id)
-        video_count = db.session.execute(stmt).scalar_one()
-        
+        video_count = counts.get(game.id, 0)
         game_json["video_count"] = video_count
         current_app.logger.debug(f"Game {game.name} (ID: {game.id}) has {video_count} videos")
         games_with_count.append(game_json)
@@ -51,18 +49,15 @@ def search_games():
     query = f"%{query.lower()}%"
     
     
-    stmt = select(Game).filter(Game.slug.like(Game.generate_slug(query)))
+    stmt = select(Game).options(selectinload(Game.folder)).filter(Game.slug.like(Game.generate_slug(query)))
     games = db.session.execute(stmt).scalars().all()
     
     
+    counts = Game.video_counts([game.id for game in games])
     games_with_count = []
     for game in games:
         game_json = game.json()
-        
-        
-        stmt = select(func.count()).select_from(Video).filter_by(game_id=game.id)
-        video_count = db.session.execute(stmt).scalar_one()
-        
+        video_count = counts.get(game.id, 0)
         game_json["video_count"] = video_count
         current_app.logger.debug(f"Game {game.name} (ID: {game.id}) has {video_count} videos")
         games_with_count.append(game_json)
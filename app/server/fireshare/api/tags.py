@@ -16,14 +16,11 @@ def get_tags():
     tags = db.session.execute(stmt).scalars().all()
     
     
+    counts = Tag.video_counts()
     tags_with_count = []
     for tag in tags:
         tag_json = tag.json()
-        
-        
-        stmt = select(func.count()).select_from(video_tags).where(video_tags.c.tag_id == tag.id)
-        video_count = db.session.execute(stmt).scalar_one()
-        tag_json["video_count"] = video_count
+        tag_json["video_count"] = counts.get(tag.id, 0)
         tags_with_count.append(tag_json)
         
     return jsonify({"tags": tags_with_count})
@@ -43,13 +40,11 @@ def search_tags():
     tags = db.session.execute(stmt).scalars().all()
     
     
+    counts = Tag.video_counts([tag.id for tag in tags])
     tags_with_count = []
     for tag in tags:
         tag_json = tag.json()
-        
-        stmt = select(func.count()).select_from(video_tags).where(video_tags.c.tag_id == tag.id)
-        video_count = db.session.execute(stmt).scalar_one()
-        tag_json["video_count"] = video_count
+        tag_json["video_count"] = counts.get(tag.id, 0)
         tags_with_count.append(tag_json)
         
     return jsonify({"tags": tags_with_count})
@@ -117,13 +112,11 @@ def register_direct_routes(app_or_blueprint):
             return jsonify({"error": "Video not found"}), 404
             
         if request.method == 'GET':
+            counts = Tag.video_counts([tag.id for tag in video.tags])
             tags_with_count = []
             for tag in video.tags:
                 tag_json = tag.json()
-                
-                stmt = select(func.count()).select_from(video_tags).where(video_tags.c.tag_id == tag.id)
-                video_count = db.session.execute(stmt).scalar_one()
-                tag_json["video_count"] = video_count
+                tag_json["video_count"] = counts.get(tag.id, 0)
                 tags_with_count.append(tag_json)
                 
             return jsonify({"tags": tags_with_count})
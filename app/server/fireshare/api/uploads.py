@@ -101,27 +101,12 @@ def public_upload_video():
     )
     db.session.add(info)
     
-    # Create processing job
-    job = VideoProcessingJob(video_id=video_id)
+    # Queue a processing job; `fireshare worker` claims and runs it
+    tag_string = ','.join(tags) if tags else None
+    job = VideoProcessingJob(video_id=video_id, game_name=game, tags=tag_string, owner_id=None)
     db.session.add(job)
     db.session.commit()
     
-    # Start processing
-    from ..worker import process_video
-    
-    # For development, we'll call the processing function directly
-    # In production, this would be enqueued in a task queue (like RQ)
-    tag_string = ','.join(tags) if tags else None
-    
-    # Process in the background
-    from threading import Thread
-    thread = Thread(
-        target=process_video, 
-        args=(video_id, game, tag_string, None)  # No owner for public uploads
-    )
-    thread.daemon = True
-    thread.start()
-    
     return jsonify({
         "message": "Video uploaded successfully",
         "video_id": video_id,
@@ -212,27 +197,12 @@ def upload_video():
     )
     db.session.add(info)
     
-    # Create processing job
-    job = VideoProcessingJob(video_id=video_id)
+    # Queue a processing job; `fireshare worker` claims and runs it
+    tag_string = ','.join(tags) if tags else None
+    job = VideoProcessingJob(video_id=video_id, game_name=game, tags=tag_string, owner_id=current_user.id)
     db.session.add(job)
     db.session.commit()
     
-    # Start processing
-    from ..worker import process_video
-    
-    # For development, we'll call the processing function directly
-    # In production, this would be enqueued in a task queue (like RQ)
-    tag_string = ','.join(tags) if tags else None
-    
-    # Process in the background
-    from threading import Thread
-    thread = Thread(
-        target=process_video, 
-        args=(video_id, game, tag_string, current_user.id)
-    )
-    thread.daemon = True
-    thread.start()
-    
     return jsonify({
         "message": "Video uploaded successfully",
         "video_id": video_id,
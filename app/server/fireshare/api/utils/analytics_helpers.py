@@ -0,0 +1,105 @@
+import datetime
+from sqlalchemy import select, func
+from ... import db
+from ...models import Video, VideoInfo, Game, User, VideoViewHourly, VideoViewDaily
+
+INTERVALS = {
+    'hour': (VideoViewHourly, datetime.timedelta(hours=1), datetime.timedelta(days=2)),
+    'day': (VideoViewDaily, datetime.timedelta(days=1), datetime.timedelta(days=30)),
+}
+# A series is zero-filled, so cap how many buckets one request can ask for
+MAX_SERIES_POINTS = 2000
+MAX_TOP_LIMIT = 100
+
+
+class AnalyticsError(ValueError):
+    pass
+
+
+def _datetime_arg(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        value = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise AnalyticsError(f"{name} must be an ISO 8601 date or datetime")
+    # Buckets are naive UTC, like every other timestamp in the database
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def parse_range(args):
+    """
+    Read `interval` (hour or day), `start` and `end` from the query string.
+    Without them a range ends now and covers the last 2 days of hours or 30
+    days of days. Returns the bucket model, bucket size, first and last bucket.
+    """
+    interval = args.get('interval', 'day')
+    if interval not in INTERVALS:
+        raise AnalyticsError(f"interval must be one of: {', '.join(INTERVALS)}")
+    model, step, default_span = INTERVALS[interval]
+    end = _datetime_arg(args, 'end') or datetime.datetime.utcnow()
+    start = _datetime_arg(args, 'start') or end - default_span
+    start, end = model.bucket_start(start), model.bucket_start(end)
+    if start > end:
+        raise AnalyticsError("start must not be after end")
+    if (end - start) / step >= MAX_SERIES_POINTS:
+        raise AnalyticsError(f"Ranges are limited to {MAX_SERIES_POINTS} {interval}s")
+    return model, step, start, end
+
+
+def view_series(model, step, start, end, *criteria):
+    """
+    Views per bucket from start to end inclusive, zero-filled, for the videos
+    matching `criteria` (any Video column filters), in one grouped query over
+    the bucket table's (bucket, video_id) index.
+    """
+    stmt = (
+        select(model.bucket, func.sum(model.views))
+        .where(model.bucket >= start, model.bucket <= end)
+        .group_by(model.bucket)
+    )
+    if criteria:
+        stmt = stmt.join(Video, Video.video_id == model.video_id).where(*criteria)
+    views = dict(db.session.execute(stmt).all())
+    series = []
+    bucket = start
+    while bucket <= end:
+        series.append({"bucket": bucket.isoformat(), "views": views.get(bucket, 0)})
+        bucket += step
+    return series
+
+
+def _top_columns(by):
+    if by == 'video':
+        return (Video.video_id.label('id'), VideoInfo.title.label('name')), (Video.video_id, VideoInfo.title)
+    if by == 'game':
+        return (Game.id.label('id'), Game.name.label('name')), (Game.id, Game.name)
+    if by == 'owner':
+        return (User.id.label('id'), User.username.label('name')), (User.id, User.username)
+    raise AnalyticsError("by must be one of: video, game, owner")
+
+
+def top_viewed(model, start, end, by='video', limit=10):
+    """
+    The `limit` videos, games or owners with the most views between start and
+    end, as dicts with id, name and views.
+    """
+    columns, group = _top_columns(by)
+    total = func.sum(model.views).label('views')
+    stmt = (
+        select(*columns, total)
+        .select_from(model)
+        .join(Video, Video.video_id == model.video_id)
+        .where(model.bucket >= start, model.bucket <= end)
+    )
+    if by == 'video':
+        stmt = stmt.join(VideoInfo, VideoInfo.video_id == Video.video_id)
+    elif by == 'game':
+        stmt = stmt.join(Game, Game.id == Video.game_id)
+    else:
+        stmt = stmt.join(User, User.id == Video.owner_id)
+    stmt = stmt.group_by(*group).order_by(total.desc()).limit(max(1, min(limit, MAX_TOP_LIMIT)))
+    return [{"id": row.id, "name": row.name, "views": row.views} for row in db.session.execute(stmt)]
@@ -0,0 +1,54 @@
+import time
+import logging
+from flask import g, request, current_app, has_request_context
+from flask_login import current_user
+from sqlalchemy import event
+
+from ... import db
+
+logger = logging.getLogger('fireshare')
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'query_diagnostics' in g:
+        g.query_diagnostics['queries'] += 1
+
+
+def init_query_diagnostics(app):
+    """
+    Count the queries of the app's engine for requests recording diagnostics.
+    Only called with QUERY_DIAGNOSTICS enabled, otherwise no listener is added.
+    """
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'before_cursor_execute', _count_query):
+        event.listen(engine, 'before_cursor_execute', _count_query)
+
+
+def start_query_diagnostics():
+    """
+    Start recording query counts and timing for this request when it was made
+    with ?debug=1 by a signed in user and QUERY_DIAGNOSTICS is enabled.
+    """
+    if not current_app.config['QUERY_DIAGNOSTICS'] or not current_user.is_authenticated:
+        return
+    if request.args.get('debug', '').lower() not in ('1', 'true', 'yes'):
+        return
+    g.query_diagnostics = {"queries": 0, "started": time.perf_counter()}
+
+
+def finish_query_diagnostics(**counts):
+    """
+    Stop recording and return the diagnostics for the response, or None when the
+    request didn't ask for them. Extra keyword arguments are included as-is.
+    """
+    diagnostics = g.pop('query_diagnostics', None)
+    if diagnostics is None:
+        return None
+    result = {
+        "queries": diagnostics["queries"],
+        "elapsed_ms": round((time.perf_counter() - diagnostics["started"]) * 1000, 2),
+        **counts
+    }
+    logger.info(f"Diagnostics for {request.path}: {result}")
+    return result
@@ -0,0 +1,276 @@
+import base64
+import binascii
+import datetime
+import json
+from sqlalchemy import select, and_, or_
+from ... import db
+from ...models import Video, VideoInfo, VideoScore, Folder, Game, Tag, User, video_tags
+
+MAX_PAGE_SIZE = 200
+# Keep IN (...) lists well below SQLite's bound parameter limit
+TAG_LOOKUP_CHUNK = 500
+
+# The only sorts the listing endpoints accept, mapped to (sort key, descending).
+# Includes the friendly names and the raw values the client has always sent.
+# Anything else is rejected, so every listing order is one of these, with a
+# tiebreaker from the same table (see _tiebreak_column), and backed by an index.
+SORT_OPTIONS = {
+    'newest': ('updated_at', True),
+    'oldest': ('updated_at', False),
+    'a-z': ('title', False),
+    'z-a': ('title', True),
+    'views': ('views', True),
+    'duration': ('duration', True),
+    'created': ('created_at', True),
+    'updated_at desc': ('updated_at', True),
+    'updated_at asc': ('updated_at', False),
+    'created_at desc': ('created_at', True),
+    'created_at asc': ('created_at', False),
+    'title asc': ('title', False),
+    'title desc': ('title', True),
+    'video_info.title asc': ('title', False),
+    'video_info.title desc': ('title', True),
+    'views asc': ('views', False),
+    'views desc': ('views', True),
+    'duration asc': ('duration', False),
+    'duration desc': ('duration', True),
+    # Only videos with a trending score, i.e. viewed recently, see VideoScore
+    'trending': ('trending', True),
+}
+DEFAULT_SORT = 'newest'
+DATETIME_SORT_KEYS = ('updated_at', 'created_at')
+# Cursors carry Video.id for the video sorts and a video_id string for the others
+_TIEBREAK_TYPES = {
+    'updated_at': int, 'created_at': int, 'views': int,
+    'title': str, 'duration': str, 'trending': str,
+}
+
+
+class ListingError(ValueError):
+    pass
+
+
+def _sort_column(key):
+    return {
+        'updated_at': Video.updated_at,
+        'created_at': Video.created_at,
+        'title': VideoInfo.title,
+        'duration': VideoInfo.duration,
+        'views': Video.view_count,
+        'trending': VideoScore.score,
+    }[key]
+
+
+def _tiebreak_column(key):
+    # The tiebreaker has to be in the sort column's index, or SQLite sorts the
+    # whole listing: the video_info indexes end in video_id, the video ones in
+    # Video.id (explicitly, or as the rowid every index carries)
+    if key in ('title', 'duration'):
+        return VideoInfo.video_id
+    if key == 'trending':
+        return VideoScore.video_id
+    return Video.id
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(key, value):
+    if key in DATETIME_SORT_KEYS and value is not None:
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
+def encode_cursor(key, value, id):
+    raw = json.dumps([key, _encode_value(value), id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        key, value, id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if key not in _TIEBREAK_TYPES or not isinstance(id, _TIEBREAK_TYPES[key]):
+            raise ValueError(key)
+        return key, _decode_value(key, value), id
+    except (binascii.Error, ValueError, TypeError, UnicodeError):
+        raise ListingError(f"Invalid cursor: {cursor}")
+
+
+def listing_query():
+    """
+    Select everything a video listing needs as plain row tuples, with folder, game
+    and owner names joined in, so a page costs one query instead of a lazy load
+    per relationship per video. Pair with serialize_rows().
+    """
+    return (
+        select(
+            Video.id, Video.video_id, Video.extension, Video.path, Video.available,
+            Video.view_count, Video.updated_at, Video.created_at, Video.folder_id, Video.game_id,
+            VideoInfo.title, VideoInfo.description, VideoInfo.private,
+            VideoInfo.width, VideoInfo.height, VideoInfo.duration, VideoInfo.framerate,
+            Folder.name.label('folder_name'),
+            Game.name.label('game_name'),
+            User.username.label('owner_username'),
+        )
+        .select_from(Video)
+        .join(VideoInfo, VideoInfo.video_id == Video.video_id)
+        .outerjoin(Folder, Folder.id == Video.folder_id)
+        .outerjoin(Game, Game.id == Video.game_id)
+        .outerjoin(User, User.id == Video.owner_id)
+    )
+
+
+def rows_in_order(ids):
+    """
+    listing_query() rows for the given Video ids, in the order given. Ids of
+    videos that no longer exist are skipped.
+    """
+    rows = {r.id: r for r in db.session.execute(listing_query().where(Video.id.in_(ids)))}
+    return [rows[id] for id in ids if id in rows]
+
+
+def _tags_by_video(video_ids):
+    tags = {}
+    for i in range(0, len(video_ids), TAG_LOOKUP_CHUNK):
+        chunk = video_ids[i:i + TAG_LOOKUP_CHUNK]
+        stmt = (
+            select(video_tags.c.video_id, Tag.name)
+            .join(Tag, Tag.id == video_tags.c.tag_id)
+            .where(video_tags.c.video_id.in_(chunk))
+        )
+        for video_id, name in db.session.execute(stmt):
+            tags.setdefault(video_id, []).append(name)
+    return tags
+
+
+def serialize_rows(rows):
+    """
+    Build the same dicts as Video.json() (plus view_count) from listing_query()
+    rows. Tags for the whole page are fetched in one query.
+    """
+    tags = _tags_by_video([r.video_id for r in rows])
+    return [{
+        "video_id": r.video_id,
+        "extension": r.extension,
+        "path": r.path,
+        "available": r.available,
+        "info": {
+            "title": r.title,
+            "description": r.description,
+            "private": r.private,
+            "width": r.width,
+            "height": r.height,
+            "duration": round(r.duration) if r.duration else 0,
+            "framerate": round(r.framerate) if r.framerate else None,
+        },
+        "folder_id": r.folder_id,
+        "folder_name": r.folder_name,
+        "game": r.game_name,
+        "game_id": r.game_id,
+        "owner": r.owner_username,
+        "tags": tags.get(r.video_id, []),
+        "private": False,
+        "view_count": r.view_count or 0,
+    } for r in rows]
+
+
+def int_arg(args, name):
+    value = args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ListingError(f"{name} must be an integer")
+
+
+def apply_filters(stmt, args):
+    """
+    Narrow a listing statement with the optional query string filters:
+    game_id, tag_id, folder_id, owner_id and available.
+    """
+    game_id = int_arg(args, 'game_id')
+    if game_id is not None:
+        stmt = stmt.filter(Video.game_id == game_id)
+    folder_id = int_arg(args, 'folder_id')
+    if folder_id is not None:
+        stmt = stmt.filter(Video.folder_id == folder_id)
+    owner_id = int_arg(args, 'owner_id')
+    if owner_id is not None:
+        stmt = stmt.filter(Video.owner_id == owner_id)
+    tag_id = int_arg(args, 'tag_id')
+    if tag_id is not None:
+        tagged = select(video_tags.c.video_id).where(video_tags.c.tag_id == tag_id)
+        stmt = stmt.filter(Video.video_id.in_(tagged))
+    available = args.get('available')
+    if available is not None and available != '':
+        stmt = stmt.filter(Video.available == (available.lower() in ('1', 'true', 'yes')))
+    return stmt
+
+
+def _cursor_value(key, row):
+    # The listing row attribute each sort key orders by
+    return getattr(row, {'views': 'view_count', 'trending': 'score'}.get(key, key))
+
+
+def _cursor_tiebreak(key, row):
+    return row.id if _tiebreak_column(key) is Video.id else row.video_id
+
+
+def _after(column, tiebreak, descending, value, last_id):
+    # Rows that come after (value, last_id) in the listing order. SQLite sorts
+    # NULLs first ascending and last descending, so they need their own terms.
+    if descending:
+        if value is None:
+            return and_(column.is_(None), tiebreak < last_id)
+        return or_(column < value, and_(column == value, tiebreak < last_id), column.is_(None))
+    if value is None:
+        return or_(and_(column.is_(None), tiebreak > last_id), column.isnot(None))
+    return or_(column > value, and_(column == value, tiebreak > last_id))
+
+
+def paginate(stmt, sort, args):
+    """
+    Order a listing_query() statement by the requested sort (with a unique
+    tiebreaker, see _tiebreak_column) and run it with keyset pagination from the `cursor` and `limit` args.
+
+    Without a `limit` the whole listing is returned, as before pagination existed.
+    Returns the page of rows and the cursor for the next page (or None). Raises
+    ListingError for a sort that isn't in SORT_OPTIONS.
+    """
+    if sort not in SORT_OPTIONS:
+        raise ListingError(f"Unknown sort '{sort}', expected one of: {', '.join(SORT_OPTIONS)}")
+    key, descending = SORT_OPTIONS[sort]
+    column = _sort_column(key)
+    tiebreak = _tiebreak_column(key)
+    if key == 'trending':
+        # Inner join, so SQLite can walk the score index and stop after the page
+        stmt = stmt.join(VideoScore, VideoScore.video_id == Video.video_id).add_columns(VideoScore.score)
+
+    cursor = args.get('cursor')
+    if cursor:
+        cursor_key, value, last_id = decode_cursor(cursor)
+        if cursor_key != key:
+            raise ListingError("Cursor does not match the requested sort")
+        stmt = stmt.filter(_after(column, tiebreak, descending, value, last_id))
+
+    if descending:
+        stmt = stmt.order_by(column.desc(), tiebreak.desc())
+    else:
+        stmt = stmt.order_by(column.asc(), tiebreak.asc())
+
+    limit = int_arg(args, 'limit')
+    if limit is None:
+        return db.session.execute(stmt).all(), None
+
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    # Fetch one row past the page to learn whether there is a next page
+    rows = db.session.execute(stmt.limit(limit + 1)).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(key, _cursor_value(key, last), _cursor_tiebreak(key, last))
@@ -16,3 +16,9 @@ def get_video_path(id, subid=None):
     ext = ".mp4" if subid else video.extension
     video_path = paths["processed"] / "video_links" / f"{id}{subid_suffix}{ext}"
     return str(video_path)
+
+
+def is_safe_id(id):
+    
+    # Ids end up in filesystem paths, so reject anything that could leave the directory
+    return bool(id) and id not in ('.', '..') and '/' not in id and '\\' not in id
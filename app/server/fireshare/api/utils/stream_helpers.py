@@ -0,0 +1,135 @@
+import os
+import secrets
+from pathlib import Path
+from urllib.parse import quote
+from flask import request, Response, current_app, send_file
+from werkzeug.http import parse_range_header, parse_if_range_header, http_date
+from werkzeug.wsgi import wrap_file
+
+# Upper bound on what a single read pulls into memory while streaming a range
+CHUNK_SIZE = 256 * 1024
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _multipart_body(path, ranges, size, mimetype, boundary):
+    for start, end in ranges:
+        yield (
+            f"\r\n--{boundary}\r\n"
+            f"Content-Type: {mimetype}\r\n"
+            f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n"
+        ).encode('ascii')
+        yield from _read_range(path, start, end)
+    yield f"\r\n--{boundary}--\r\n".encode('ascii')
+
+
+def _resolve_ranges(ranges, size):
+    resolved = []
+    for start, stop in ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            resolved.append((start, stop))
+    return resolved
+
+
+def _if_range_matches(etag, mtime):
+    if_range = parse_if_range_header(request.headers.get('If-Range'))
+    if if_range.etag is not None:
+        return if_range.etag == etag.strip('"')
+    if if_range.date is not None:
+        return int(mtime) <= if_range.date.timestamp()
+    return True
+
+
+def stream_file(path, mimetype):
+    """
+    Serve a file with HTTP range support without ever reading more than
+    CHUNK_SIZE into memory.
+
+    Full responses (and open-ended ranges running to EOF) go through
+    wsgi.file_wrapper so servers that support it can sendfile() the body.
+    Bounded single ranges are streamed in chunks, several ranges come back as
+    multipart/byteranges, and unsatisfiable ranges get a 416. If-Range is
+    honoured against the ETag and Last-Modified sent with every response.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+    }
+    head = request.method == 'HEAD'
+
+    ranges = parse_range_header(request.headers.get('Range'))
+    if ranges is not None and ranges.units != 'bytes':
+        ranges = None
+    if ranges is not None and 'If-Range' in request.headers and not _if_range_matches(etag, stat.st_mtime):
+        ranges = None
+
+    if ranges is None:
+        headers['Content-Length'] = str(size)
+        body = None if head else wrap_file(request.environ, open(path, 'rb'), buffer_size=CHUNK_SIZE)
+        return Response(body, 200, headers=headers, mimetype=mimetype, direct_passthrough=True)
+
+    resolved = _resolve_ranges(ranges.ranges, size)
+    if not resolved:
+        headers['Content-Range'] = f"bytes */{size}"
+        return Response(status=416, headers=headers)
+
+    if len(resolved) == 1:
+        start, end = resolved[0]
+        headers['Content-Range'] = f"bytes {start}-{end - 1}/{size}"
+        headers['Content-Length'] = str(end - start)
+        if head:
+            body = None
+        elif end == size:
+            # Runs to EOF, so the file wrapper can't overshoot and can use sendfile
+            f = open(path, 'rb')
+            f.seek(start)
+            body = wrap_file(request.environ, f, buffer_size=CHUNK_SIZE)
+        else:
+            body = _read_range(path, start, end)
+        return Response(body, 206, headers=headers, mimetype=mimetype, direct_passthrough=True)
+
+    boundary = secrets.token_hex(16)
+    body = None if head else _multipart_body(path, resolved, size, mimetype, boundary)
+    return Response(body, 206, headers=headers, mimetype=f"multipart/byteranges; boundary={boundary}", direct_passthrough=True)
+
+
+def accel_redirect(path, mimetype):
+    """
+    Return an empty response that tells nginx to serve `path` (which must live
+    under PROCESSED_DIRECTORY) from its internal /_accel/ location.
+    """
+    processed = Path(current_app.config['PROCESSED_DIRECTORY']).absolute()
+    relative = Path(path).absolute().relative_to(processed)
+    uri = f"{current_app.config['ACCEL_REDIRECT_PREFIX']}/{quote(relative.as_posix())}"
+    # nginx keeps the upstream Content-Type, so it has to be the file's, not text/html
+    return Response(status=200, headers={'X-Accel-Redirect': uri}, mimetype=mimetype)
+
+
+def send_processed_file(path, mimetype, stream=False):
+    """
+    Deliver a file from PROCESSED_DIRECTORY, offloading to nginx when
+    ENABLE_ACCEL_REDIRECT is set. Otherwise video is streamed with stream_file()
+    and small files go through send_file().
+    """
+    if current_app.config.get('ENABLE_ACCEL_REDIRECT'):
+        return accel_redirect(path, mimetype)
+    if stream:
+        return stream_file(path, mimetype)
+    return send_file(path, mimetype=mimetype)
@@ -1,61 +1,54 @@
 import json
-import os, re, string
+import datetime
+import os, string
 import shutil
-import random
 import logging
-from flask import Blueprint, render_template, request, Response, jsonify, current_app, send_file, redirect
+from flask import Blueprint, render_template, request, Response, jsonify, current_app, redirect
 from flask_login import current_user, login_required
-from sqlalchemy import select, func, text, delete, update
+from sqlalchemy import select, delete, update
 from pathlib import Path
 
 from .. import db
-from ..models import Video, VideoInfo, VideoView, Tag, Folder, Game, video_tags
-from .utils.path_helpers import get_video_path
+from ..view_buffer import view_buffer
+from ..models import Video, VideoInfo, VideoView, ShuffleSession, Tag, Folder, Game, video_tags
+from .utils.path_helpers import get_video_path, is_safe_id
 from .utils.response_helpers import api_error, api_success
+from .utils.listing_helpers import ListingError, MAX_PAGE_SIZE, apply_filters, int_arg, listing_query, paginate, rows_in_order, serialize_rows
+from .utils.stream_helpers import send_processed_file
+from .utils.diagnostics import start_query_diagnostics, finish_query_diagnostics
 
 
 videos_bp = Blueprint('videos', __name__, url_prefix='/api/videos')
 
 
+def listing_response(videos_json, next_cursor):
+    
+    response = {"videos": videos_json, "next_cursor": next_cursor}
+    diagnostics = finish_query_diagnostics(returned=len(videos_json))
+    if diagnostics:
+        response["diagnostics"] = diagnostics
+    return response
+
+
 @videos_bp.route('', methods=['GET'])
 @login_required
 def get_videos():
     
     sort = request.args.get('sort', 'updated_at desc')
+    start_query_diagnostics()
     
-    # Map intuitive sort options to SQL sort expressions
-    sort_mapping = {
-        'newest': 'updated_at desc',
-        'oldest': 'updated_at asc',
-        'a-z': 'title asc',
-        'z-a': 'title desc'
-    }
-    
-    # Apply mapping if a friendly sort option is used
-    sql_sort = sort_mapping.get(sort, sort)
-    
-    if sort and "views" in sort:
-        stmt = select(Video).join(VideoInfo)
-        videos = db.session.execute(stmt).scalars().all()
-    else:
-        stmt = select(Video).join(VideoInfo).order_by(text(sql_sort))
-        videos = db.session.execute(stmt).scalars().all()
-
-    videos_json = []
-    for v in videos:
-        vjson = v.json()
-        vjson["view_count"] = VideoView.count(v.video_id)
-        videos_json.append(vjson)
+    try:
+        stmt = apply_filters(listing_query(), request.args)
+        rows, next_cursor = paginate(stmt, sort, request.args)
+    except ListingError as e:
+        return api_error(str(e))
 
-    if sort == "views asc":
-        videos_json = sorted(videos_json, key=lambda d: d['view_count'])
-    if sort == 'views desc':
-        videos_json = sorted(videos_json, key=lambda d: d['view_count'], reverse=True)
+    videos_json = serialize_rows(rows)
 
     
     logging.info(f"LEGACY get_videos endpoint returning {len(videos_json)} videos")
     
-    return jsonify({"videos": videos_json})
+    return jsonify(listing_response(videos_json, next_cursor))
 
 
 @videos_bp.route('/my', methods=['GET'])
@@ -63,60 +56,33 @@ def get_videos():
 def get_my_videos():
     
     sort = request.args.get('sort', 'newest')
+    start_query_diagnostics()
     
-    # Map intuitive sort options to SQL sort expressions
-    sort_mapping = {
-        'newest': 'updated_at desc',
-        'oldest': 'updated_at asc',
-        'a-z': 'title asc',
-        'z-a': 'title desc'
-    }
-    
-    # Apply mapping if a friendly sort option is used
-    sql_sort = sort_mapping.get(sort, sort)
-    
-    logging.info(f"get_my_videos called by user {current_user.username} with sort={sort} (SQL sort: {sql_sort})")
+    logging.info(f"get_my_videos called by user {current_user.username} with sort={sort}")
     logging.info(f"User authenticated: {current_user.is_authenticated}, Admin: {current_user.is_admin() if hasattr(current_user, 'is_admin') else 'N/A'}")
     
     try:
         # Get the current user's ID
         user_id = current_user.id
         
-        # First, debug all videos to check if they exist in the database
-        all_videos_stmt = select(Video)
-        all_videos = db.session.execute(all_videos_stmt).scalars().all()
-        logging.info(f"DEBUG: Total videos in database: {len(all_videos)}")
-        for v in all_videos:
-            logging.info(f"DEBUG: Video ID: {v.video_id}, Owner ID: {v.owner_id}, Game: {v.game.name if v.game else 'None'}")
-        
         # Filter videos by owner_id (the current user)
-        if sort and "views" in sort:
-            stmt = select(Video).join(VideoInfo).filter(Video.owner_id == user_id)
-            videos = db.session.execute(stmt).scalars().all()
-        else:
-            stmt = select(Video).join(VideoInfo).filter(Video.owner_id == user_id).order_by(text(sql_sort))
-            videos = db.session.execute(stmt).scalars().all()
+        stmt = listing_query().filter(Video.owner_id == user_id)
+        stmt = apply_filters(stmt, request.args)
+        rows, next_cursor = paginate(stmt, sort, request.args)
 
         
-        logging.info(f"Found {len(videos)} videos in database for user {current_user.username} (ID: {user_id})")
+        logging.info(f"Found {len(rows)} videos in database for user {current_user.username} (ID: {user_id})")
         
-        videos_json = []
-        for v in videos:
-            vjson = v.json()
-            vjson["view_count"] = VideoView.count(v.video_id)
-            videos_json.append(vjson)
-
-        if sort == "views asc":
-            videos_json = sorted(videos_json, key=lambda d: d['view_count'])
-        if sort == 'views desc':
-            videos_json = sorted(videos_json, key=lambda d: d['view_count'], reverse=True)
+        videos_json = serialize_rows(rows)
 
         
         logging.info(f"get_my_videos returning {len(videos_json)} videos for user {current_user.username}")
         
         
-        return jsonify({"videos": videos_json})
+        return jsonify(listing_response(videos_json, next_cursor))
         
+    except ListingError as e:
+        return api_error(str(e))
     except Exception as e:
         logging.error(f"Error in get_my_videos: {str(e)}", exc_info=True)
         return jsonify({"videos": [], "error": str(e)})
@@ -125,65 +91,33 @@ def get_my_videos():
 def get_public_videos():
     
     sort = request.args.get('sort', 'newest')
+    start_query_diagnostics()
     
-    # Map intuitive sort options to SQL sort expressions
-    sort_mapping = {
-        'newest': 'updated_at desc',
-        'oldest': 'updated_at asc',
-        'a-z': 'title asc',
-        'z-a': 'title desc'
-    }
+    logging.info(f"get_public_videos called with sort={sort}")
     
-    # Apply mapping if a friendly sort option is used
-    sql_sort = sort_mapping.get(sort, sort)
-    
-    logging.info(f"get_public_videos called with sort={sort} (SQL sort: {sql_sort})")
+    # All videos are now public - only unavailable ones are hidden
+    try:
+        stmt = listing_query().filter(Video.available == True)
+        stmt = apply_filters(stmt, request.args)
+        rows, next_cursor = paginate(stmt, sort, request.args)
+    except ListingError as e:
+        return api_error(str(e))
     
-    # First, debug all videos to check if they exist in the database
-    all_videos_stmt = select(Video)
-    all_videos = db.session.execute(all_videos_stmt).scalars().all()
-    logging.info(f"DEBUG: Total videos in database (public): {len(all_videos)}")
-    for v in all_videos:
-        logging.info(f"DEBUG: Video ID: {v.video_id}, Owner ID: {v.owner_id}, Available: {v.available}, Game: {v.game.name if v.game else 'None'}")
+    logging.info(f"Found {len(rows)} public videos in database")
     
-    # All videos are now public - no filter needed
-    if sort and "views" in sort:
-        stmt = select(Video).join(VideoInfo)
-        videos = db.session.execute(stmt).scalars().all()
-    else:
-        stmt = select(Video).join(VideoInfo).order_by(text(sql_sort))
-        videos = db.session.execute(stmt).scalars().all()
-    
-    logging.info(f"Found {len(videos)} public videos in database")
-    
-    videos_json = []
-    for v in videos:
-        vjson = v.json()
-        if (not vjson["available"]):
-            logging.info(f"Skipping unavailable video: {v.video_id}")
-            continue
-        vjson["view_count"] = VideoView.count(v.video_id)
-        videos_json.append(vjson)
-
-    if sort == "views asc":
-        videos_json = sorted(videos_json, key=lambda d: d['view_count'])
-    if sort == 'views desc':
-        videos_json = sorted(videos_json, key=lambda d: d['view_count'], reverse=True)
+    videos_json = serialize_rows(rows)
 
     logging.info(f"get_public_videos returning {len(videos_json)} videos")
     
-    return jsonify({"videos": videos_json})
+    return jsonify(listing_response(videos_json, next_cursor))
 
 @videos_bp.route('/random', methods=['GET'])
 @login_required
 def get_random_video():
     
-    
-    stmt = select(func.count()).select_from(Video)
-    row_count = db.session.execute(stmt).scalar_one()
-    
-    stmt = select(Video).offset(int(row_count * random.random()))
-    random_video = db.session.execute(stmt).scalar_one_or_none()
+    random_video = Video.random()
+    if not random_video:
+        return Response(status=404, response="There are no videos")
     
     current_app.logger.info(f"Fetched random video {random_video.video_id}: {random_video.info.title}")
     return jsonify(random_video.json())
@@ -192,16 +126,57 @@ def get_random_video():
 def get_random_public_video():
     
     # All videos are now public - no filter for private needed
-    stmt = select(func.count()).select_from(Video).filter_by(available=True)
-    row_count = db.session.execute(stmt).scalar_one()
-    
-    stmt = select(Video).filter_by(available=True).offset(int(row_count * random.random()))
-    random_video = db.session.execute(stmt).scalar_one_or_none()
+    random_video = Video.random(Video.available == True)
+    if not random_video:
+        return Response(status=404, response="There are no videos")
     
     current_app.logger.info(f"Fetched public random video {random_video.video_id}: {random_video.info.title}")
     return jsonify(random_video.json())
 
 
+def shuffle_page(session, args):
+    
+    offset = int_arg(args, 'offset') or 0
+    limit = max(1, min(int_arg(args, 'limit') or 20, MAX_PAGE_SIZE))
+    ids, total = session.page(max(offset, 0), limit)
+    next_offset = offset + limit if offset + limit < total else None
+    return {
+        "session_id": session.id,
+        "seed": session.seed,
+        "total": total,
+        "videos": serialize_rows(rows_in_order(ids)),
+        "next_offset": next_offset,
+    }
+
+@videos_bp.route('/shuffle', methods=['POST'])
+@login_required
+def create_shuffle():
+    
+    # Freeze a random order of the matching videos so a client can page through
+    # it without repeats
+    try:
+        stmt = apply_filters(select(Video.id), request.args)
+        seed = int_arg(request.args, 'seed')
+        video_ids = db.session.execute(stmt).scalars().all()
+        max_age = datetime.timedelta(hours=current_app.config['SHUFFLE_SESSION_HOURS'])
+        session = ShuffleSession.create(video_ids, seed, max_age)
+        return jsonify(shuffle_page(session, request.args))
+    except ListingError as e:
+        return api_error(str(e))
+
+@videos_bp.route('/shuffle/<session_id>', methods=['GET'])
+@login_required
+def get_shuffle(session_id):
+    
+    session = db.session.get(ShuffleSession, session_id)
+    if not session:
+        return api_error("Shuffle session not found or expired", 404)
+    try:
+        return jsonify(shuffle_page(session, request.args))
+    except ListingError as e:
+        return api_error(str(e))
+
+
 @videos_bp.route('/w/<video_id>')
 def video_metadata(video_id):
     
@@ -292,9 +267,10 @@ def register_direct_routes(app_or_blueprint):
         else:
             return Response(status=404, response=f"A video with id: {id}, does not exist.")
     
-    @app_or_blueprint.route('/api/video/poster', methods=['GET'])
-    def get_video_poster():
-        video_id = request.args['id']
+    def poster_response(video_id):
+        
+        if not is_safe_id(video_id):
+            return Response(status=404)
         webm_poster_path = Path(current_app.config["PROCESSED_DIRECTORY"], "derived", video_id, "boomerang-preview.webm")
         jpg_poster_path = Path(current_app.config["PROCESSED_DIRECTORY"], "derived", video_id, "poster.jpg")
         
@@ -302,7 +278,7 @@ def register_direct_routes(app_or_blueprint):
         if request.args.get('animated'):
             # Check if the animated poster exists
             if webm_poster_path.exists():
-                return send_file(webm_poster_path, mimetype='video/webm')
+                return send_processed_file(webm_poster_path, 'video/webm')
             else:
                 # Return a default loading file or empty response
                 logging.info(f"Animated poster for {video_id} not found, still processing")
@@ -310,35 +286,20 @@ def register_direct_routes(app_or_blueprint):
         else:
             # Check if the static poster exists
             if jpg_poster_path.exists():
-                return send_file(jpg_poster_path, mimetype='image/jpg')
+                return send_processed_file(jpg_poster_path, 'image/jpg')
             else:
                 # Return 202 status to indicate processing in progress
                 logging.info(f"Static poster for {video_id} not found, still processing")
                 return Response(status=202)  # 202 Accepted - processing in progress
     
+    @app_or_blueprint.route('/api/video/poster', methods=['GET'])
+    def get_video_poster():
+        return poster_response(request.args['id'])
+    
     # Add direct path parameter route for poster (modern style)
     @app_or_blueprint.route('/api/video/poster/<video_id>', methods=['GET'])
     def get_video_poster_by_id(video_id):
-        webm_poster_path = Path(current_app.config["PROCESSED_DIRECTORY"], "derived", video_id, "boomerang-preview.webm")
-        jpg_poster_path = Path(current_app.config["PROCESSED_DIRECTORY"], "derived", video_id, "poster.jpg")
-        
-        # Check if this is a request for an animated poster
-        if request.args.get('animated'):
-            # Check if the animated poster exists
-            if webm_poster_path.exists():
-                return send_file(webm_poster_path, mimetype='video/webm')
-            else:
-                # Return a default loading file or empty response
-                logging.info(f"Animated poster for {video_id} not found, still processing")
-                return Response(status=202)  # 202 Accepted - processing in progress
-        else:
-            # Check if the static poster exists
-            if jpg_poster_path.exists():
-                return send_file(jpg_poster_path, mimetype='image/jpg')
-            else:
-                # Return 202 status to indicate processing in progress
-                logging.info(f"Static poster for {video_id} not found, still processing")
-                return Response(status=202)  # 202 Accepted - processing in progress
+        return poster_response(video_id)
     
     @app_or_blueprint.route('/api/video/view', methods=['POST'])
     def add_video_view():
@@ -348,7 +309,7 @@ def register_direct_routes(app_or_blueprint):
             ip_address = request.headers.getlist("X-Forwarded-For")[0].split(",")[0]
         else:
             ip_address = request.remote_addr
-        VideoView.add_view(video_id, ip_address)
+        view_buffer.add(video_id, ip_address)
         return Response(status=200)
     
     @app_or_blueprint.route('/api/video/<video_id>/views', methods=['GET'])
@@ -362,34 +323,15 @@ def register_direct_routes(app_or_blueprint):
         
         video_id = request.args.get('id')
         subid = request.args.get('subid')
-        video_path = get_video_path(video_id, subid)
-        file_size = os.stat(video_path).st_size
-        start = 0
-        length = 10240
-
-        range_header = request.headers.get('Range', None)
-        if range_header:
-            m = re.search('([0-9]+)-([0-9]*)', range_header)
-            g = m.groups()
-            byte1, byte2 = 0, None
-            if g[0]:
-                byte1 = int(g[0])
-            if g[1]:
-                byte2 = int(g[1])
-            if byte1 < file_size:
-                start = byte1
-            if byte2:
-                length = byte2 + 1 - byte1
-            else:
-                length = file_size - start
-
-        with open(video_path, 'rb') as f:
-            f.seek(start)
-            chunk = f.read(length)
-
-        rv = Response(chunk, 206, mimetype='video/mp4', content_type='video/mp4', direct_passthrough=True)
-        rv.headers.add('Content-Range', 'bytes {0}-{1}/{2}'.format(start, start + length - 1, file_size))
-        return rv
+        if not is_safe_id(video_id) or (subid and not subid.isdigit()):
+            return Response(status=404)
+        try:
+            video_path = get_video_path(video_id, subid)
+        except Exception:
+            return Response(status=404, response=f"A video with id: {video_id}, does not exist.")
+        if not os.path.exists(video_path):
+            return Response(status=404)
+        return send_processed_file(video_path, 'video/mp4', stream=True)
     
     
 
@@ -2,24 +2,46 @@
 import os
 import json
 import click
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import current_app
 from fireshare import create_app, db, util, logger
-from fireshare.models import User, Video, VideoInfo, Tag, Folder
+from fireshare.models import User, Video, VideoInfo, VideoView, VideoViewSketch, VideoViewHourly, VideoScore, Tag, Folder, FileIdentity, DirectoryState
 from werkzeug.security import generate_password_hash
 from pathlib import Path
-from sqlalchemy import func, select, update
+from sqlalchemy import func, select, update, delete, or_
+from sqlalchemy.orm import joinedload
 import time
 
 from .constants import SUPPORTED_FILE_EXTENSIONS
 
+# How many probed videos sync_metadata writes per commit
+METADATA_COMMIT_BATCH = 100
+# First retry delay for a file ffprobe couldn't read, doubled on every further failure
+PROBE_RETRY_SECONDS = 60
+# Videos compact-views folds per transaction
+VIEW_COMPACT_CHUNK = 500
+
 @click.group()
 def cli():
     pass
 
+def _cached_video_id(video_file, path, identities):
+    # Only hash files whose (device, inode, size, mtime) changed since the last scan
+    stat = video_file.stat()
+    identity = identities.get(path)
+    if identity is not None and identity.matches(stat):
+        return identity.video_id
+    video_id = util.video_id(video_file)
+    if identity is None:
+        identity = FileIdentity(path=path)
+        db.session.add(identity)
+        identities[path] = identity
+    identity.update_from(stat, video_id)
+    return video_id
+
 @cli.command()
 def init_db():
-    with create_app().app_context():
+    with create_app(web=False).app_context():
         db.create_all()
         logger.info(f"Created database file at {current_app.config['SQLALCHEMY_DATABASE_URI']}")
 
@@ -27,71 +49,223 @@ def init_db():
 @click.option("--username", "-u", help="Username", required=True)
 @click.option("--password", "-p", help="Password", prompt=True, hide_input=True)
 def add_user(username, password):
-    with create_app().app_context():
+    with create_app(web=False).app_context():
         new_user = User(username=username, password=generate_password_hash(password))
         db.session.add(new_user)
         db.session.commit()
         click.echo(f"Created user {username}")
 
-@cli.command()
+@cli.command("scan-videos")
 @click.option("--root", "-r", help="root video path to scan", required=False)
-def scan_videos(root):
-    with create_app().app_context():
-        paths = current_app.config['PATHS']
-        videos_path = paths["video"]
-        video_links = paths["processed"] / "video_links"
-        
-        config_file = open(paths["data"] / "config.json")
-        video_config = json.load(config_file)["app_config"]["video_defaults"]
-        config_file.close()
-        
-        if not video_links.is_dir():
-            video_links.mkdir()
+def scan_videos_command(root):
+    with create_app(web=False).app_context():
+        scan_videos(root)
 
-        logger.info(f"Scanning {str(videos_path)} for {', '.join(SUPPORTED_FILE_EXTENSIONS)} video files")
-        video_files = [f for f in (videos_path / root if root else videos_path).glob('**/*') if f.is_file() and f.suffix.lower() in SUPPORTED_FILE_EXTENSIONS]
-        
-        
-        stmt = select(Video)
-        video_rows = db.session.execute(stmt).scalars().all()
-
-        new_videos = []
-        for vf in video_files:
-            path = str(vf.relative_to(videos_path)) 
-            video_id = util.video_id(vf)
-            existing = next((vr for vr in video_rows if vr.video_id == video_id), None)
-            duplicate = next((dvr for dvr in new_videos if dvr.video_id == video_id), None)
-            if duplicate:
-                logger.info(f"Found duplicate video {video_id} as {str(path)}, skipping...")
-            elif existing:
-                if not existing.available:
-                    logger.info(f"Updating Video {video_id}, available=True")
-                    db.session.query(Video).filter_by(video_id=existing.video_id).update({ "available": True })
-                if not existing.created_at:
-                    created_at = datetime.fromtimestamp(os.path.getctime(f"{videos_path}/{path}"))
-                    logger.info(f"Updating Video {video_id}, created_at={created_at}")
-                    db.session.query(Video).filter_by(video_id=existing.video_id).update({ "created_at": created_at })
-                if not existing.updated_at:
-                    updated_at = datetime.fromtimestamp(os.path.getmtime(f"{videos_path}/{path}"))
-                    logger.info(f"Updating Video {video_id}, updated_at={updated_at}")
-                    db.session.query(Video).filter_by(video_id=existing.video_id).update({ "updated_at": updated_at })
-            else:
+def scan_videos(root=None):
+    paths = current_app.config['PATHS']
+    videos_path = paths["video"]
+    video_links = paths["processed"] / "video_links"
+    
+    config_file = open(paths["data"] / "config.json")
+    video_config = json.load(config_file)["app_config"]["video_defaults"]
+    config_file.close()
+    
+    if not video_links.is_dir():
+        video_links.mkdir()
+
+    logger.info(f"Scanning {str(videos_path)} for {', '.join(SUPPORTED_FILE_EXTENSIONS)} video files")
+    start = os.path.normpath(root) if root else ''
+    start = '' if start == '.' else start
+    file_paths, listings = util.walk_video_files(videos_path, start, DirectoryState.listings(), current_app.config['SCAN_IGNORE_PATTERNS'])
+    video_files = [videos_path / p for p in file_paths]
+    DirectoryState.save_listings(listings, start)
+    
+    
+    stmt = select(Video)
+    videos_by_id = {vr.video_id: vr for vr in db.session.execute(stmt).scalars()}
+    identities = FileIdentity.by_path()
+
+    new_videos = []
+    new_video_ids = set()
+    scanned_paths = set()
+    for vf in video_files:
+        path = str(vf.relative_to(videos_path)) 
+        scanned_paths.add(path)
+        video_id = _cached_video_id(vf, path, identities)
+        existing = videos_by_id.get(video_id)
+        if video_id in new_video_ids:
+            logger.info(f"Found duplicate video {video_id} as {str(path)}, skipping...")
+        elif existing:
+            if not existing.available:
+                logger.info(f"Updating Video {video_id}, available=True")
+                db.session.query(Video).filter_by(video_id=existing.video_id).update({ "available": True })
+            if not existing.created_at:
                 created_at = datetime.fromtimestamp(os.path.getctime(f"{videos_path}/{path}"))
+                logger.info(f"Updating Video {video_id}, created_at={created_at}")
+                db.session.query(Video).filter_by(video_id=existing.video_id).update({ "created_at": created_at })
+            if not existing.updated_at:
                 updated_at = datetime.fromtimestamp(os.path.getmtime(f"{videos_path}/{path}"))
-                v = Video(video_id=video_id, extension=vf.suffix, path=path, available=True, created_at=created_at, updated_at=updated_at)
-                logger.info(f"Adding new Video {video_id} at {str(path)} (created {created_at.isoformat()}, updated {updated_at.isoformat()})")
-                new_videos.append(v)
-        
-        if new_videos:
-            db.session.add_all(new_videos)
+                logger.info(f"Updating Video {video_id}, updated_at={updated_at}")
+                db.session.query(Video).filter_by(video_id=existing.video_id).update({ "updated_at": updated_at })
         else:
-            logger.info(f"No new videos found, checked {len(video_files)} files.")
-        db.session.commit()
+            created_at = datetime.fromtimestamp(os.path.getctime(f"{videos_path}/{path}"))
+            updated_at = datetime.fromtimestamp(os.path.getmtime(f"{videos_path}/{path}"))
+            v = Video(video_id=video_id, extension=vf.suffix, path=path, available=True, created_at=created_at, updated_at=updated_at)
+            logger.info(f"Adding new Video {video_id} at {str(path)} (created {created_at.isoformat()}, updated {updated_at.isoformat()})")
+            new_videos.append(v)
+            new_video_ids.add(video_id)
+    
+    if new_videos:
+        db.session.add_all(new_videos)
+    else:
+        logger.info(f"No new videos found, checked {len(video_files)} files.")
+    db.session.commit()
 
-        fd = os.open(str(video_links.absolute()), os.O_DIRECTORY)
-        for nv in new_videos:
-            src = Path((paths["video"] / nv.path).absolute())
-            dst = Path(paths["processed"] / "video_links" / (nv.video_id + nv.extension))
+    fd = os.open(str(video_links.absolute()), os.O_DIRECTORY)
+    for nv in new_videos:
+        src = Path((paths["video"] / nv.path).absolute())
+        dst = Path(paths["processed"] / "video_links" / (nv.video_id + nv.extension))
+        common_root = Path(*os.path.commonprefix([src.parts, dst.parts]))
+        num_up = len(dst.parts)-1 - len(common_root.parts)
+        prefix = "../" * num_up
+        rel_src = Path(prefix + str(src).replace(str(common_root), ''))
+        if not dst.exists():
+            logger.info(f"Linking {str(rel_src)} --> {str(dst)}")
+            try:
+                os.symlink(src, dst, dir_fd=fd)
+            except FileExistsError:
+                logger.info(f"{dst} exists already")
+        info = VideoInfo(video_id=nv.video_id, title=Path(nv.path).stem, private=video_config["private"])
+        db.session.add(info)
+    os.close(fd)
+    db.session.commit()
+
+    existing_videos = Video.query.filter_by(available=True).all()
+    logger.info(f"Verifying {len(existing_videos):,} video files still exist...")
+    for ev in existing_videos:
+        if ev.path in scanned_paths:
+            continue
+        file_path = Path((paths["video"] / ev.path).absolute())
+        # The walk saw everything under the scanned root, so anything there it didn't find is missing
+        if start and not ev.path.startswith(start + '/'):
+            logger.debug(f"Verifying video {ev.video_id} at {file_path} is available")
+            if file_path.exists():
+                continue
+        logger.warn(f"Video {ev.video_id} at {file_path} was not found")
+        db.session.query(Video).filter_by(video_id=ev.video_id).update({ "available": False})
+
+    if not root:
+        # Drop cached identities for files that are no longer on disk
+        gone = [fi for p, fi in identities.items() if p not in scanned_paths]
+        for fi in gone:
+            db.session.delete(fi)
+    db.session.commit()
+    return [nv.video_id for nv in new_videos]
+
+@cli.command("scan-video")
+@click.option("--path", "-p", help="path to video to scan", required=False)
+@click.option("--game", "-g", help="game name for the video (required for organization)", required=False)
+@click.option("--tags", "-t", help="comma-separated list of tags to apply to the video", required=False)
+@click.option("--owner-id", "-o", help="user ID of the video owner", type=int, required=False)
+def scan_video_command(path, game, tags, owner_id):
+    with create_app(web=False).app_context():
+        scan_video(path, game, tags, owner_id)
+
+def scan_video(path, game=None, tags=None, owner_id=None):
+    paths = current_app.config['PATHS']
+    videos_path = paths["video"]
+    video_links = paths["processed"] / "video_links"
+    thumbnail_skip = current_app.config['THUMBNAIL_VIDEO_LOCATION'] or 0
+    if thumbnail_skip > 0 and thumbnail_skip <= 100:
+        thumbnail_skip = thumbnail_skip / 100
+    else:
+        thumbnail_skip = 0
+    
+    config_file = open(paths["data"] / "config.json")
+    video_config = json.load(config_file)["app_config"]["video_defaults"]
+    config_file.close()
+    
+    if not video_links.is_dir():
+        video_links.mkdir()
+    
+    video_file = (videos_path / path) if (videos_path / path).is_file() and (videos_path / path).suffix.lower() in SUPPORTED_FILE_EXTENSIONS else None
+    if video_file:
+        logger.info(f"Scanning {str(video_file)}")
+
+        path = str(video_file.relative_to(videos_path)) 
+        video_id = _cached_video_id(video_file, path, FileIdentity.by_path(path))
+        stmt = select(Video).filter_by(video_id=video_id).limit(1)
+        existing = db.session.execute(stmt).scalar_one_or_none()
+        if existing:
+            if not existing.available:
+                logger.info(f"Updating Video {video_id}, available=True")
+                
+                stmt = update(Video).where(Video.video_id == existing.video_id).values(available=True)
+                db.session.execute(stmt)
+            if not existing.created_at:
+                created_at = datetime.fromtimestamp(os.path.getctime(f"{videos_path}/{path}"))
+                logger.info(f"Updating Video {video_id}, created_at={created_at}")
+                
+                stmt = update(Video).where(Video.video_id == existing.video_id).values(created_at=created_at)
+                db.session.execute(stmt)
+            if not existing.updated_at:
+                updated_at = datetime.fromtimestamp(os.path.getmtime(f"{videos_path}/{path}"))
+                logger.info(f"Updating Video {video_id}, updated_at={updated_at}")
+                
+                stmt = update(Video).where(Video.video_id == existing.video_id).values(updated_at=updated_at)
+                db.session.execute(stmt)
+            
+            
+            video = existing
+            
+            
+            if game:
+                logger.info(f"Setting game for video {video_id}: {game}")
+                video.set_game(game)
+            
+            
+            if tags:
+                
+                
+                stmt = select(Video).filter_by(video_id=video_id)
+                video_obj = db.session.execute(stmt).scalar_one_or_none()
+                if video_obj:
+                    tag_list = [t.strip() for t in tags.split(',')]
+                    logger.info(f"Adding tags to video {video_id}: {tag_list}")
+                    for tag_name in tag_list:
+                        if tag_name:
+                            video_obj.add_tag(tag_name)
+            
+            if owner_id:
+                
+                stmt = select(User).filter_by(id=owner_id)
+                user = db.session.execute(stmt).scalar_one_or_none()
+                if user:
+                    logger.info(f"Setting owner of video {video_id} to user {user.username} (ID: {user.id})")
+                    
+                    stmt = update(Video).where(Video.video_id == video.video_id).values(owner_id=user.id)
+                    db.session.execute(stmt)
+            
+            db.session.commit()
+        else:
+            created_at = datetime.fromtimestamp(os.path.getctime(f"{videos_path}/{path}"))
+            updated_at = datetime.fromtimestamp(os.path.getmtime(f"{videos_path}/{path}"))
+            v = Video(video_id=video_id, extension=video_file.suffix, path=path, available=True, created_at=created_at, updated_at=updated_at)
+            
+            
+            if owner_id:
+                
+                stmt = select(User).filter_by(id=owner_id)
+                user = db.session.execute(stmt).scalar_one_or_none()
+                if user:
+                    logger.info(f"Setting owner of new video {video_id} to user {user.username} (ID: {user.id})")
+                    v.owner_id = user.id
+            
+            logger.info(f"Adding new Video {video_id} at {str(path)} (created {created_at.isoformat()}, updated {updated_at.isoformat()})")
+            db.session.add(v)
+            fd = os.open(str(video_links.absolute()), os.O_DIRECTORY)
+            src = Path((paths["video"] / v.path).absolute())
+            dst = Path(paths["processed"] / "video_links" / (video_id + video_file.suffix))
             common_root = Path(*os.path.commonprefix([src.parts, dst.parts]))
             num_up = len(dst.parts)-1 - len(common_root.parts)
             prefix = "../" * num_up
@@ -102,79 +276,29 @@ def scan_videos(root):
                     os.symlink(src, dst, dir_fd=fd)
                 except FileExistsError:
                     logger.info(f"{dst} exists already")
-            info = VideoInfo(video_id=nv.video_id, title=Path(nv.path).stem, private=video_config["private"])
+            os.close(fd)
+            info = VideoInfo(video_id=v.video_id, title=Path(v.path).stem, private=video_config["private"])
             db.session.add(info)
-        db.session.commit()
+            db.session.commit()
 
-        existing_videos = Video.query.filter_by(available=True).all()
-        logger.info(f"Verifying {len(existing_videos):,} video files still exist...")
-        for ev in existing_videos:
-            file_path = Path((paths["video"] / ev.path).absolute())
-            logger.debug(f"Verifying video {ev.video_id} at {file_path} is available")
-            if not file_path.exists():
-                logger.warn(f"Video {ev.video_id} at {file_path} was not found")
-                db.session.query(Video).filter_by(video_id=ev.video_id).update({ "available": False})
-        db.session.commit()
+            logger.info("Syncing metadata")
+            sync_metadata(video=video_id)
+            
+            stmt = select(VideoInfo).filter(VideoInfo.video_id==video_id)
+            info = db.session.execute(stmt).scalar_one()
 
-@cli.command()
-@click.pass_context
-@click.option("--path", "-p", help="path to video to scan", required=False)
-@click.option("--game", "-g", help="game name for the video (required for organization)", required=False)
-@click.option("--tags", "-t", help="comma-separated list of tags to apply to the video", required=False)
-@click.option("--owner-id", "-o", help="user ID of the video owner", type=int, required=False)
-def scan_video(ctx, path, game, tags, owner_id):
-    with create_app().app_context():
-        paths = current_app.config['PATHS']
-        videos_path = paths["video"]
-        video_links = paths["processed"] / "video_links"
-        thumbnail_skip = current_app.config['THUMBNAIL_VIDEO_LOCATION'] or 0
-        if thumbnail_skip > 0 and thumbnail_skip <= 100:
-            thumbnail_skip = thumbnail_skip / 100
-        else:
-            thumbnail_skip = 0
-        
-        config_file = open(paths["data"] / "config.json")
-        video_config = json.load(config_file)["app_config"]["video_defaults"]
-        config_file.close()
-        
-        if not video_links.is_dir():
-            video_links.mkdir()
-        
-        video_file = (videos_path / path) if (videos_path / path).is_file() and (videos_path / path).suffix.lower() in SUPPORTED_FILE_EXTENSIONS else None
-        if video_file:
-            video_rows = Video.query.all()
-            logger.info(f"Scanning {str(video_file)}")
-
-            path = str(video_file.relative_to(videos_path)) 
-            video_id = util.video_id(video_file)
-            existing = next((vr for vr in video_rows if vr.video_id == video_id), None)
-            if existing:
-                if not existing.available:
-                    logger.info(f"Updating Video {video_id}, available=True")
+            
+            try:
+                if game:
+                    logger.info(f"Setting game for new video {video_id}: {game}")
                     
-                    stmt = update(Video).where(Video.video_id == existing.video_id).values(available=True)
-                    db.session.execute(stmt)
-                if not existing.created_at:
-                    created_at = datetime.fromtimestamp(os.path.getctime(f"{videos_path}/{path}"))
-                    logger.info(f"Updating Video {video_id}, created_at={created_at}")
                     
-                    stmt = update(Video).where(Video.video_id == existing.video_id).values(created_at=created_at)
-                    db.session.execute(stmt)
-                if not existing.updated_at:
-                    updated_at = datetime.fromtimestamp(os.path.getmtime(f"{videos_path}/{path}"))
-                    logger.info(f"Updating Video {video_id}, updated_at={updated_at}")
-                    
-                    stmt = update(Video).where(Video.video_id == existing.video_id).values(updated_at=updated_at)
-                    db.session.execute(stmt)
-                
-                
-                video = existing
-                
-                
-                if game:
-                    logger.info(f"Setting game for video {video_id}: {game}")
-                    video.set_game(game)
-                
+                    stmt = select(Video).filter_by(video_id=video_id)
+                    fresh_video = db.session.execute(stmt).scalar_one_or_none()
+                    if fresh_video:
+                        fresh_video.set_game(game)
+                    else:
+                        logger.error(f"Could not find video {video_id} to set game")
                 
                 if tags:
                     
@@ -183,132 +307,57 @@ def scan_video(ctx, path, game, tags, owner_id):
                     video_obj = db.session.execute(stmt).scalar_one_or_none()
                     if video_obj:
                         tag_list = [t.strip() for t in tags.split(',')]
-                        logger.info(f"Adding tags to video {video_id}: {tag_list}")
+                        logger.info(f"Adding tags to new video {video_id}: {tag_list}")
                         for tag_name in tag_list:
                             if tag_name:
                                 video_obj.add_tag(tag_name)
-                
-                if owner_id:
-                    
-                    stmt = select(User).filter_by(id=owner_id)
-                    user = db.session.execute(stmt).scalar_one_or_none()
-                    if user:
-                        logger.info(f"Setting owner of video {video_id} to user {user.username} (ID: {user.id})")
-                        
-                        stmt = update(Video).where(Video.video_id == video.video_id).values(owner_id=user.id)
-                        db.session.execute(stmt)
+                    else:
+                        logger.error(f"Could not find video {video_id} to add tags")
                 
                 db.session.commit()
-            else:
-                created_at = datetime.fromtimestamp(os.path.getctime(f"{videos_path}/{path}"))
-                updated_at = datetime.fromtimestamp(os.path.getmtime(f"{videos_path}/{path}"))
-                v = Video(video_id=video_id, extension=video_file.suffix, path=path, available=True, created_at=created_at, updated_at=updated_at)
+            except Exception as e:
+                logger.error(f"Error setting game or tags: {str(e)}")
+                db.session.rollback()
                 
+            
+            
+            processed_root = Path(current_app.config['PROCESSED_DIRECTORY'])
+            logger.info(f"Checking for videos with missing posters...")
+            derived_path = Path(processed_root, "derived", info.video_id)
+            video_path = Path(processed_root, "video_links", info.video_id + video_file.suffix)
+            
+            
+            if video_path.exists():
                 
-                if owner_id:
-                    
-                    stmt = select(User).filter_by(id=owner_id)
-                    user = db.session.execute(stmt).scalar_one_or_none()
-                    if user:
-                        logger.info(f"Setting owner of new video {video_id} to user {user.username} (ID: {user.id})")
-                        v.owner_id = user.id
-                
-                logger.info(f"Adding new Video {video_id} at {str(path)} (created {created_at.isoformat()}, updated {updated_at.isoformat()})")
-                db.session.add(v)
-                fd = os.open(str(video_links.absolute()), os.O_DIRECTORY)
-                src = Path((paths["video"] / v.path).absolute())
-                dst = Path(paths["processed"] / "video_links" / (video_id + video_file.suffix))
-                common_root = Path(*os.path.commonprefix([src.parts, dst.parts]))
-                num_up = len(dst.parts)-1 - len(common_root.parts)
-                prefix = "../" * num_up
-                rel_src = Path(prefix + str(src).replace(str(common_root), ''))
-                if not dst.exists():
-                    logger.info(f"Linking {str(rel_src)} --> {str(dst)}")
-                    try:
-                        os.symlink(src, dst, dir_fd=fd)
-                    except FileExistsError:
-                        logger.info(f"{dst} exists already")
-                info = VideoInfo(video_id=v.video_id, title=Path(v.path).stem, private=video_config["private"])
-                db.session.add(info)
-                db.session.commit()
-
-                logger.info("Syncing metadata")
-                ctx.invoke(sync_metadata, video=video_id)
-                
-                stmt = select(VideoInfo).filter(VideoInfo.video_id==video_id)
-                info = db.session.execute(stmt).scalar_one()
-
+                if not derived_path.exists():
+                    derived_path.mkdir(parents=True, exist_ok=True)
+                    logger.info(f"Created derived directory at {str(derived_path)}")
                 
-                try:
-                    if game:
-                        logger.info(f"Setting game for new video {video_id}: {game}")
-                        
-                        
-                        stmt = select(Video).filter_by(video_id=video_id)
-                        fresh_video = db.session.execute(stmt).scalar_one_or_none()
-                        if fresh_video:
-                            fresh_video.set_game(game)
-                        else:
-                            logger.error(f"Could not find video {video_id} to set game")
-                    
-                    if tags:
-                        
-                        
-                        stmt = select(Video).filter_by(video_id=video_id)
-                        video_obj = db.session.execute(stmt).scalar_one_or_none()
-                        if video_obj:
-                            tag_list = [t.strip() for t in tags.split(',')]
-                            logger.info(f"Adding tags to new video {video_id}: {tag_list}")
-                            for tag_name in tag_list:
-                                if tag_name:
-                                    video_obj.add_tag(tag_name)
-                        else:
-                            logger.error(f"Could not find video {video_id} to add tags")
-                    
-                    db.session.commit()
-                except Exception as e:
-                    logger.error(f"Error setting game or tags: {str(e)}")
-                    db.session.rollback()
-                    
                 
+                poster_path = Path(derived_path, "poster.jpg")
+                should_create_poster = not poster_path.exists()
+                if should_create_poster:
+                    poster_time = int(info.duration * thumbnail_skip) if info.duration else 0
+                    logger.info(f"Creating poster at position {poster_time}s for video {info.video_id}")
+                    util.create_poster(video_path, derived_path / "poster.jpg", poster_time, **util.poster_options(current_app.config))
+                else:
+                    logger.debug(f"Skipping creation of poster for video {info.video_id} because it exists at {str(poster_path)}")
                 
-                processed_root = Path(current_app.config['PROCESSED_DIRECTORY'])
-                logger.info(f"Checking for videos with missing posters...")
-                derived_path = Path(processed_root, "derived", info.video_id)
-                video_path = Path(processed_root, "video_links", info.video_id + video_file.suffix)
                 
+                boomerang_path = Path(derived_path, "boomerang-preview.webm")
+                if not boomerang_path.exists():
+                    logger.info(f"Creating boomerang preview for video {info.video_id}")
+                    util.create_boomerang_preview(video_path, boomerang_path)
                 
-                if video_path.exists():
-                    
-                    if not derived_path.exists():
-                        derived_path.mkdir(parents=True, exist_ok=True)
-                        logger.info(f"Created derived directory at {str(derived_path)}")
-                    
-                    
-                    poster_path = Path(derived_path, "poster.jpg")
-                    should_create_poster = not poster_path.exists()
-                    if should_create_poster:
-                        poster_time = int(info.duration * thumbnail_skip) if info.duration else 0
-                        logger.info(f"Creating poster at position {poster_time}s for video {info.video_id}")
-                        util.create_poster(video_path, derived_path / "poster.jpg", poster_time)
-                    else:
-                        logger.debug(f"Skipping creation of poster for video {info.video_id} because it exists at {str(poster_path)}")
-                    
-                    
-                    boomerang_path = Path(derived_path, "boomerang-preview.webm")
-                    if not boomerang_path.exists():
-                        logger.info(f"Creating boomerang preview for video {info.video_id}")
-                        util.create_boomerang_preview(video_path, boomerang_path)
-                    
-                    db.session.commit()
-                else:
-                    logger.warn(f"Skipping creation of poster for video {info.video_id} because the video at {str(video_path)} does not exist or is not accessible")
-        else:
-            logger.info(f"Invalid video file, unable to scan: {str(videos_path / path)}")
+                db.session.commit()
+            else:
+                logger.warn(f"Skipping creation of poster for video {info.video_id} because the video at {str(video_path)} does not exist or is not accessible")
+    else:
+        logger.info(f"Invalid video file, unable to scan: {str(videos_path / path)}")
 
 @cli.command()
 def repair_symlinks():
-    with create_app().app_context():
+    with create_app(web=False).app_context():
         paths = current_app.config['PATHS']
         video_links = paths["processed"] / "video_links"
 
@@ -333,61 +382,85 @@ def repair_symlinks():
                 except FileExistsError:
                     logger.info(f"{dst} exists already")
 
-@cli.command()
+@cli.command("sync-metadata")
 @click.option("--video", "-v", help="The video to sync metadata from", default=None)
-def sync_metadata(video):
-    with create_app().app_context():
-        paths = current_app.config['PATHS']
-        
+@click.option("--jobs", "-j", help="Number of videos to probe at once (defaults to the number of CPUs)", type=int, default=None)
+def sync_metadata_command(video, jobs):
+    with create_app(web=False).app_context():
+        sync_metadata(video, jobs)
+
+def sync_metadata(video=None, jobs=None, vinfos=None):
+    paths = current_app.config['PATHS']
+    
+    if vinfos is not None:
+        videos = [vi for vi in vinfos if vi.info == None]
+    else:
         if video:
             stmt = select(VideoInfo).filter(VideoInfo.video_id==video)
         else:
             stmt = select(VideoInfo).filter(VideoInfo.info==None)
+        stmt = stmt.options(joinedload(VideoInfo.video))
         videos = db.session.execute(stmt).scalars().all()
-        logger.info(f'Found {len(videos):,} videos without metadata')
-        for v in videos:
-            vpath = paths["processed"] / "video_links" / str(v.video_id + v.video.extension)
-            if Path(vpath).is_file():
-                info = None
-                while info == None:
-                    info = util.get_media_info(vpath)
-                    if info == None:
-                        corruptVideoWarning = "There may be a corrupt video in your video Directory. See your logs for more info!"
-                        if not corruptVideoWarning in current_app.config['WARNINGS']:
-                            current_app.config['WARNINGS'].append(corruptVideoWarning)
-                        logger.warn(f"[{v.video.path}] - There may be a corrupt file in your video directory. Or, you may be recording to the video directory and haven't finished yet.")
-                        logger.warn(f"For more info and to find the offending file, run this command in your container: \"stat {vpath}\"")
-                        logger.warn("I'll try to process this file again in 60 seconds...")
-                        time.sleep(60)
-                
-                corruptVideoWarning = "There may be a corrupt video in your video Directory. See your logs for more info!"
-                if corruptVideoWarning in current_app.config['WARNINGS']:
-                    position = current_app.config['WARNINGS'].index(corruptVideoWarning)
-                    current_app.config['WARNINGS'].pop(position)
-
-                vcodec = [i for i in info if i['codec_type'] == 'video'][0]
-                duration = 0
-                if 'duration' in vcodec:
-                    duration = float(vcodec['duration'])
-                elif 'tags' in vcodec:
-                    if 'DURATION' in vcodec['tags']:
-                        duration = util.dur_string_to_seconds(vcodec['tags']['DURATION'])
-                    else:
-                        duration = 0
-                width, height = int(vcodec['width']), int(vcodec['height'])
-                logger.info(f'Scanned {v.video_id} duration={duration}s, resolution={width}x{height}: {v.video.path}')
-                v.info = json.dumps(info)
-                v.duration = duration
-                v.width = width
-                v.height = height
-                db.session.add(v)
-                db.session.commit()
+    logger.info(f'Found {len(videos):,} videos without metadata')
+
+    now = datetime.utcnow()
+    stable_seconds = current_app.config['PROBE_STABLE_SECONDS']
+    pending = []
+    for v in videos:
+        vpath = paths["processed"] / "video_links" / str(v.video_id + v.video.extension)
+        try:
+            stat = os.stat(vpath)
+        except OSError:
+            logger.warn(f"Missing or invalid symlink at {vpath} to video {v.video_id} (original location: {v.video.path})")
+            continue
+        if not video and time.time() - stat.st_mtime < stable_seconds:
+            # Still being written (e.g. recording straight into the video directory), try again on a later run
+            logger.info(f"[{v.video.path}] - Modified in the last {stable_seconds}s, skipping until it stops changing")
+            v.defer_probe(stat.st_size, now + timedelta(seconds=stable_seconds))
+        elif video or v.probe_due(stat.st_size, now):
+            pending.append((v, vpath, stat.st_size))
+        else:
+            logger.debug(f"[{v.video.path}] - Quarantined until {v.probe_retry_at.isoformat()}, skipping")
+    db.session.commit()
+
+    scanned = 0
+    # ffprobe runs on the pool, results are written back here in batches
+    results = util.run_parallel(lambda item: util.get_media_info(item[1]), pending, jobs)
+    for done, ((v, vpath, size), info) in enumerate(results, 1):
+        if info == None:
+            delay = min(PROBE_RETRY_SECONDS * 2 ** (v.probe_attempts or 0), current_app.config['PROBE_MAX_BACKOFF_SECONDS'])
+            v.defer_probe(size, now + timedelta(seconds=delay), failed=True)
+            logger.warn(f"[{v.video.path}] - There may be a corrupt file in your video directory. Or, you may be recording to the video directory and haven't finished yet.")
+            logger.warn(f"For more info and to find the offending file, run this command in your container: \"stat {vpath}\"")
+            logger.warn(f"Failed {v.probe_attempts} time(s), I'll try to process this file again in {delay} seconds, or sooner if it changes")
+        else:
+            fields = util.extract_media_fields(info)
+            v.info = json.dumps(info)
+            v.clear_probe_quarantine()
+            if fields:
+                logger.info(f'Scanned {v.video_id} duration={fields["duration"]}s, resolution={fields["width"]}x{fields["height"]}: {v.video.path}')
+                v.set_media_fields(fields)
             else:
-                logger.warn(f"Missing or invalid symlink at {vpath} to video {v.video_id} (original location: {v.video.path})")
+                logger.warn(f"[{v.video.path}] - No video stream found in {vpath}")
+            scanned += 1
+        db.session.add(v)
+        if done % METADATA_COMMIT_BATCH == 0:
+            db.session.commit()
+    db.session.commit()
+
+    corruptVideoWarning = "There may be a corrupt video in your video Directory. See your logs for more info!"
+    stmt = select(func.count()).select_from(VideoInfo).filter(VideoInfo.info == None, VideoInfo.probe_attempts > 0)
+    if db.session.execute(stmt).scalar_one():
+        if not corruptVideoWarning in current_app.config['WARNINGS']:
+            current_app.config['WARNINGS'].append(corruptVideoWarning)
+    elif corruptVideoWarning in current_app.config['WARNINGS']:
+        position = current_app.config['WARNINGS'].index(corruptVideoWarning)
+        current_app.config['WARNINGS'].pop(position)
+    return scanned
 
 @cli.command()
 def create_web_videos():
-    with create_app().app_context():
+    with create_app(web=False).app_context():
         paths = current_app.config['PATHS']
         video_links = paths["processed"] / "video_links"
         
@@ -422,85 +495,129 @@ def create_web_videos():
                 logger.warn(f"Missing or invalid symlink at {vpath} to video {v.video_id} (original location: {v.video.path})")
         
 
-@cli.command()
+@cli.command("create-posters")
 @click.option("--regenerate", "-r", help="Overwrite existing posters", is_flag=True)
 @click.option("--skip", "-s", help="Amount to skip into the video before extracting a poster image, as a %, e.g. 0.05 for 5%", type=float, default=0)
-def create_posters(regenerate, skip):
-    with create_app().app_context():
-        processed_root = Path(current_app.config['PROCESSED_DIRECTORY'])
-        
-        stmt = select(VideoInfo)
+@click.option("--jobs", "-j", help="Number of posters to generate at once (defaults to the number of CPUs)", type=int, default=None)
+def create_posters_command(regenerate, skip, jobs):
+    with create_app(web=False).app_context():
+        create_posters(regenerate, skip, jobs)
+
+def create_posters(regenerate=False, skip=0, jobs=None, vinfos=None):
+    processed_root = Path(current_app.config['PROCESSED_DIRECTORY'])
+    
+    if vinfos is None:
+        stmt = select(VideoInfo).options(joinedload(VideoInfo.video))
         vinfos = db.session.execute(stmt).scalars().all()
-        logger.info(f"Checking for videos with missing posters...")
-        for vi in vinfos:
-            derived_path = Path(processed_root, "derived", vi.video_id)
-            video_path = Path(processed_root, "video_links", vi.video_id + vi.video.extension)
-            if not video_path.exists():
-                logger.warn(f"Skipping creation of poster for video {vi.video_id} because the video at {str(video_path)} does not exist or is not accessible")
-                continue
-            poster_path = Path(derived_path, "poster.jpg")
-            should_create_poster = (not poster_path.exists() or regenerate)
-            if should_create_poster:
-                if not derived_path.exists():
-                    derived_path.mkdir(parents=True)
-                poster_time = int(vi.duration * skip)
-                util.create_poster(video_path, derived_path / "poster.jpg", poster_time)
-            else:
-                logger.debug(f"Skipping creation of poster for video {vi.video_id} because it exists at {str(poster_path)}")
+    logger.info(f"Checking for videos with missing posters...")
+    work = []
+    for vi in vinfos:
+        derived_path = Path(processed_root, "derived", vi.video_id)
+        video_path = Path(processed_root, "video_links", vi.video_id + vi.video.extension)
+        if not video_path.exists():
+            logger.warn(f"Skipping creation of poster for video {vi.video_id} because the video at {str(video_path)} does not exist or is not accessible")
+            continue
+        poster_path = Path(derived_path, "poster.jpg")
+        should_create_poster = (not poster_path.exists() or regenerate)
+        if should_create_poster:
+            if not derived_path.exists():
+                derived_path.mkdir(parents=True)
+            poster_time = int((vi.duration or 0) * skip)
+            work.append((video_path, poster_path, poster_time))
+        else:
+            logger.debug(f"Skipping creation of poster for video {vi.video_id} because it exists at {str(poster_path)}")
 
-@cli.command()
+    options = util.poster_options(current_app.config)
+    for _ in util.run_parallel(lambda item: util.create_poster(*item, **options), work, jobs):
+        pass
+    return len(work)
+
+@cli.command("create-boomerang-posters")
 @click.option("--regenerate", "-r", help="Overwrite existing posters", is_flag=True)
-def create_boomerang_posters(regenerate):
-    with create_app().app_context():
-        processed_root = Path(current_app.config['PROCESSED_DIRECTORY'])
-        
-        stmt = select(VideoInfo)
+@click.option("--jobs", "-j", help="Number of previews to generate at once (defaults to the number of CPUs)", type=int, default=None)
+def create_boomerang_posters_command(regenerate, jobs):
+    with create_app(web=False).app_context():
+        create_boomerang_posters(regenerate, jobs)
+
+def create_boomerang_posters(regenerate=False, jobs=None, vinfos=None):
+    processed_root = Path(current_app.config['PROCESSED_DIRECTORY'])
+    
+    if vinfos is None:
+        stmt = select(VideoInfo).options(joinedload(VideoInfo.video))
         vinfos = db.session.execute(stmt).scalars().all()
-        for vi in vinfos:
-            derived_path = Path(processed_root, "derived", vi.video_id)
-            video_path = Path(processed_root, "video_links", vi.video_id + vi.video.extension)
-            if not video_path.exists():
-                logger.info(f"Skipping creation of boomerang poster for video {vi.video_id} because the video at {str(video_path)} does not exist or is not accessible")
-                continue
-            poster_path = Path(derived_path, "boomerang-preview.webm")
-            should_create_poster = (not poster_path.exists() or regenerate)
-            if should_create_poster:
-                if not derived_path.exists():
-                    derived_path.mkdir(parents=True)
-                util.create_boomerang_preview(video_path, poster_path)
-            else:
-                logger.info(f"Skipping creation of boomerang poster for video {vi.video_id} because it exists at {str(poster_path)}")
+    work = []
+    for vi in vinfos:
+        derived_path = Path(processed_root, "derived", vi.video_id)
+        video_path = Path(processed_root, "video_links", vi.video_id + vi.video.extension)
+        if not video_path.exists():
+            logger.info(f"Skipping creation of boomerang poster for video {vi.video_id} because the video at {str(video_path)} does not exist or is not accessible")
+            continue
+        poster_path = Path(derived_path, "boomerang-preview.webm")
+        should_create_poster = (not poster_path.exists() or regenerate)
+        if should_create_poster:
+            if not derived_path.exists():
+                derived_path.mkdir(parents=True)
+            work.append((video_path, poster_path))
+        else:
+            logger.info(f"Skipping creation of boomerang poster for video {vi.video_id} because it exists at {str(poster_path)}")
 
-@cli.command()
-@click.pass_context
+    for _ in util.run_parallel(lambda item: util.create_boomerang_preview(*item), work, jobs):
+        pass
+    return len(work)
+
+def _record_stage(timing, stage, started, processed=None):
+    elapsed = time.time() - started
+    timing[stage] = elapsed
+    if processed is not None:
+        timing[f'{stage}_videos'] = processed
+        timing[f'{stage}_per_second'] = round(processed / elapsed, 2) if elapsed else None
+
+@cli.command("bulk-import")
 @click.option("--root", "-r", help="root video path to scan", required=False)
 @click.option("--auto-tag", "-a", help="Auto-tag videos based on folder structure", is_flag=True)
-def bulk_import(ctx, root, auto_tag):
-    with create_app().app_context():
-        paths = current_app.config['PATHS']
-        if util.lock_exists(paths["data"]):
-            logger.info(f"A scan process is currently active... Aborting. (Remove {paths['data']/'fireshare.lock'} to continue anyway)")
-            return
-        util.create_lock(paths["data"])
-        
-        thumbnail_skip = current_app.config['THUMBNAIL_VIDEO_LOCATION'] or 0
-        if thumbnail_skip > 0 and thumbnail_skip <= 100:
-            thumbnail_skip = thumbnail_skip / 100
-        else:
-            thumbnail_skip = 0
+@click.option("--jobs", "-j", help="Number of ffmpeg/ffprobe processes to run at once (defaults to the number of CPUs)", type=int, default=lambda: os.cpu_count() or 1)
+def bulk_import_command(root, auto_tag, jobs):
+    with create_app(web=False).app_context():
+        bulk_import(root, auto_tag, jobs)
+
+def bulk_import(root=None, auto_tag=False, jobs=None):
+    paths = current_app.config['PATHS']
+    if util.lock_exists(paths["data"]):
+        logger.info(f"A scan process is currently active... Aborting. (Remove {paths['data']/'fireshare.lock'} to continue anyway)")
+        return
+    util.create_lock(paths["data"])
+    
+    thumbnail_skip = current_app.config['THUMBNAIL_VIDEO_LOCATION'] or 0
+    if thumbnail_skip > 0 and thumbnail_skip <= 100:
+        thumbnail_skip = thumbnail_skip / 100
+    else:
+        thumbnail_skip = 0
 
-        timing = {}
+    try:
+        timing = {'jobs': jobs}
         s = time.time()
-        ctx.invoke(scan_videos, root=root)
-        timing['scan_videos'] = time.time() - s
+        new_video_ids = scan_videos(root=root)
+        _record_stage(timing, 'scan_videos', s, len(new_video_ids))
         
+        # The remaining stages share one work list: the videos this scan added
+        # (scan_videos leaves them unprobed) plus any earlier runs couldn't probe
+        # yet, so they get posters as soon as they do. Existing videos with
+        # metadata are left alone, `fireshare create-posters` checks every video.
+        stmt = select(VideoInfo).options(joinedload(VideoInfo.video)).filter(VideoInfo.info == None)
+        vinfos = db.session.execute(stmt).scalars().all()
+        timing['work_list_videos'] = len(vinfos)
+
         s = time.time()
-        ctx.invoke(sync_metadata)
-        timing['sync_metadata'] = time.time() - s
-        
+        processed = sync_metadata(jobs=jobs, vinfos=vinfos)
+        _record_stage(timing, 'sync_metadata', s, processed)
+
+        s = time.time()
+        processed = create_posters(skip=thumbnail_skip, jobs=jobs, vinfos=vinfos)
+        _record_stage(timing, 'create_posters', s, processed)
+
         s = time.time()
-        ctx.invoke(create_posters, skip=thumbnail_skip)
-        timing['create_posters'] = time.time() - s
+        processed = create_boomerang_posters(jobs=jobs, vinfos=vinfos)
+        _record_stage(timing, 'create_boomerang_posters', s, processed)
         
         
         if auto_tag:
@@ -515,11 +632,65 @@ def bulk_import(ctx, root, auto_tag):
                     logger.info(f"Auto-tagging video {video.video_id} with tag '{folder_name}' based on folder structure")
                     video.add_tag(folder_name)
             db.session.commit()
-            timing['auto_tagging'] = time.time() - s
+            _record_stage(timing, 'auto_tagging', s)
 
         logger.info(f"Finished bulk import. Timing info: {json.dumps(timing)}")
-
+    finally:
         util.remove_lock(paths["data"])
 
+@cli.command()
+@click.option("--concurrency", "-c", help="Number of uploads to process at once", type=int, default=lambda: int(os.getenv('WORKER_CONCURRENCY', '2')))
+@click.option("--poll-interval", help="Seconds to wait between checks for new jobs", type=float, default=2.0)
+@click.option("--max-attempts", help="Fail a job after it has been claimed this many times", type=int, default=3)
+def worker(concurrency, poll_interval, max_attempts):
+    with create_app(web=False).app_context():
+        from .worker import run_worker
+        run_worker(concurrency=max(1, concurrency), poll_interval=poll_interval, max_attempts=max_attempts)
+
+@cli.command()
+@click.option("--debounce", help="Seconds without events before a file is checked", type=float, default=2.0)
+@click.option("--stable-seconds", help="Seconds a file's size must stay the same before it is imported", type=float, default=10.0)
+@click.option("--initial-scan/--no-initial-scan", help="Run a full import once the watches are in place", default=True)
+def watch(debounce, stable_seconds, initial_scan):
+    with create_app(web=False).app_context():
+        from .watcher import run_watcher
+        run_watcher(
+            ingest=lambda path: scan_video(path),
+            reconcile=lambda: bulk_import(jobs=os.cpu_count()),
+            debounce=debounce, stable_seconds=stable_seconds, initial_scan=initial_scan)
+
+@cli.command("compact-views")
+def compact_views_command():
+    with create_app(web=False).app_context():
+        compact_views()
+
+def compact_views():
+    retention = current_app.config['VIEW_HOURLY_RETENTION_DAYS']
+    pruned = db.session.execute(delete(VideoViewHourly)
+        .where(VideoViewHourly.bucket < datetime.utcnow() - timedelta(days=retention))).rowcount
+    db.session.commit()
+    logger.info(f"Pruned {pruned:,} hourly view bucket(s) older than {retention} days, the daily buckets are kept")
+
+    if current_app.config['VIEW_COUNT_MODE'] != 'approximate':
+        return
+    days = current_app.config['VIEW_EXACT_WINDOW_DAYS']
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    stale = or_(VideoView.created_at < cutoff, VideoView.created_at == None)
+    video_ids = db.session.execute(select(VideoView.video_id).where(stale).distinct()).scalars().all()
+    compacted = 0
+    for i in range(0, len(video_ids), VIEW_COMPACT_CHUNK):
+        compacted += VideoViewSketch.compact(cutoff, video_ids[i:i + VIEW_COMPACT_CHUNK])
+    logger.info(f"Folded {compacted:,} view(s) older than {days} days of {len(video_ids):,} video(s) into their sketches")
+
+@cli.command("compute-trending")
+def compute_trending_command():
+    with create_app(web=False).app_context():
+        compute_trending()
+
+def compute_trending():
+    half_life = current_app.config['TRENDING_HALF_LIFE_HOURS']
+    updated = VideoScore.refresh(datetime.utcnow(), half_life)
+    logger.info(f"Updated trending scores of {updated:,} video(s), half-life {half_life}h")
+
 if __name__=="__main__":
     cli()
@@ -0,0 +1,164 @@
+import os
+import queue
+import atexit
+import logging
+import threading
+import time
+from sqlalchemy import event
+
+from . import db
+
+logger = logging.getLogger('fireshare')
+
+# The SQLite file is shared by every gunicorn worker thread, `fireshare worker`,
+# the watcher and scheduled scans. WAL lets readers carry on while one of them
+# writes, busy_timeout makes a writer wait for the lock instead of failing with
+# "database is locked", and BatchedWriter folds the small high-frequency writes
+# (views, job progress) of a process into one transaction per flush.
+
+
+def sqlite_pragmas(config):
+    return [
+        ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+        ('synchronous', 'NORMAL'),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT_MS']),
+        ('mmap_size', config['SQLITE_MMAP_SIZE_MB'] * 1024 * 1024),
+        # Negative values are in KiB rather than pages
+        ('cache_size', -config['SQLITE_CACHE_SIZE_KB']),
+        ('temp_store', 'MEMORY'),
+    ]
+
+
+def engine_options(config):
+    return {
+        # Same wait as busy_timeout, for the connect itself
+        'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000},
+    }
+
+
+def init_engine(app):
+    """
+    Apply sqlite_pragmas() to every new connection of the app's engine. Call
+    after db.init_app(app), before anything has connected.
+    """
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = sqlite_pragmas(app.config)
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+class BatchedWriter:
+    """
+    Applies small, frequent writes from one background thread per process.
+
+    submit(handler, item) queues the item and returns at once. The thread
+    collects items for up to `flush_interval` seconds (or `max_batch` items),
+    calls handler(items) once per handler with everything queued for it, and
+    commits the lot in a single transaction. Handlers must only stage changes
+    on db.session, the writer commits or rolls back. With a flush_interval of
+    0 items are written straight away by the caller.
+    """
+
+    def __init__(self, flush_interval=1.0, max_batch=500):
+        self.app = None
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._atexit = False
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_interval = app.config['DB_WRITE_FLUSH_SECONDS']
+        if not self._atexit:
+            atexit.register(self.flush)
+            self._atexit = True
+
+    def _start(self):
+        # Started lazily, and again in a forked child, which inherits the queue but not the thread
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run, name='fireshare-writer', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def submit(self, handler, item):
+        if self.flush_interval <= 0:
+            self._write([(handler, item)])
+            return
+        if self._pid != os.getpid():
+            self._start()
+        self._queue.put((handler, item))
+
+    def write(self, handler, items):
+        """
+        Call handler(items) and commit now, in the calling thread but never at
+        the same time as a queued flush. Returns False if the write failed.
+        """
+        return self._write([(handler, item) for item in items])
+
+    def flush(self, timeout=10):
+        """
+        Write everything queued so far and wait for it, e.g. before the process
+        exits.
+        """
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put((None, done))
+        done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch = []
+            waiting = []
+            deadline = None
+            while len(batch) < self.max_batch:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    break
+                try:
+                    handler, item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if handler is None:
+                    waiting.append(item)
+                    break
+                batch.append((handler, item))
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch:
+                self._write(batch)
+            for done in waiting:
+                done.set()
+
+    def _write(self, batch):
+        grouped = {}
+        for handler, item in batch:
+            grouped.setdefault(handler, []).append(item)
+        with self._write_lock, self.app.app_context():
+            try:
+                for handler, items in grouped.items():
+                    handler(items)
+                db.session.commit()
+                return True
+            except Exception as ex:
+                db.session.rollback()
+                logger.error(f"Failed to write {len(batch)} queued update(s): {ex}")
+                return False
+
+
+writer = BatchedWriter()
@@ -1,9 +1,15 @@
 import json
+import math
+import random
+import secrets
 import datetime
 import enum
 import re
+from flask import current_app
 from flask_login import UserMixin
-from sqlalchemy import select, update, func
+from sqlalchemy import select, insert, update, delete, func, or_
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from . import db
 
 class UserRole(enum.Enum):
@@ -127,6 +133,15 @@ class Game(db.Model):
             Folder.for_game(game)
             
         return game
+
+    @classmethod
+    def video_counts(cls, game_ids=None):
+        
+        # One GROUP BY instead of a COUNT per game
+        stmt = select(Video.game_id, func.count()).where(Video.game_id.isnot(None)).group_by(Video.game_id)
+        if game_ids is not None:
+            stmt = stmt.where(Video.game_id.in_(game_ids))
+        return dict(db.session.execute(stmt).all())
     
     def json(self):
         
@@ -171,6 +186,15 @@ class Tag(db.Model):
             db.session.add(tag)
             db.session.commit()
         return tag
+
+    @classmethod
+    def video_counts(cls, tag_ids=None):
+        
+        # One GROUP BY instead of a COUNT per tag
+        stmt = select(video_tags.c.tag_id, func.count()).group_by(video_tags.c.tag_id)
+        if tag_ids is not None:
+            stmt = stmt.where(video_tags.c.tag_id.in_(tag_ids))
+        return dict(db.session.execute(stmt).all())
     
     def json(self):
         
@@ -241,6 +265,15 @@ class Folder(db.Model):
             db.session.add(folder)
             db.session.commit()
         return folder
+
+    @classmethod
+    def video_counts(cls, folder_ids=None):
+        
+        # One GROUP BY instead of a COUNT per folder
+        stmt = select(Video.folder_id, func.count()).where(Video.folder_id.isnot(None)).group_by(Video.folder_id)
+        if folder_ids is not None:
+            stmt = stmt.where(Video.folder_id.in_(folder_ids))
+        return dict(db.session.execute(stmt).all())
     
     def json(self):
         return {
@@ -266,12 +299,18 @@ video_tags = db.Table('video_tags',
 
 class Video(db.Model):
     __tablename__ = "video"
+    # One per listing sort, ending in the id tiebreaker (see listing_helpers.SORT_OPTIONS)
+    __table_args__ = (
+        db.Index('ix_video_updated_at_id', 'updated_at', 'id'),
+        db.Index('ix_video_created_at_id', 'created_at', 'id'),
+    )
 
     id        = db.Column(db.Integer, primary_key=True)
     video_id  = db.Column(db.String(32), index=True, nullable=False)
     extension = db.Column(db.String(8), nullable=False)
     path      = db.Column(db.String(2048), index=True, nullable=False)
     available = db.Column(db.Boolean, default=True)
+    view_count = db.Column(db.Integer, default=0, index=True)
     created_at = db.Column(db.DateTime(), default=datetime.datetime.utcnow)
     updated_at = db.Column(db.DateTime(), default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     
@@ -286,6 +325,34 @@ class Video(db.Model):
     info = db.relationship("VideoInfo", back_populates="video", uselist=False, lazy="joined")
     owner = db.relationship('User', backref=db.backref('videos', lazy='dynamic'))
     tags = db.relationship('Tag', secondary=video_tags, backref=db.backref('videos', lazy='dynamic'))
+
+    @classmethod
+    def eager_load_options(cls):
+        
+        # Everything json() touches, so serializing doesn't lazy load per video
+        return (
+            joinedload(cls.folder),
+            joinedload(cls.game),
+            joinedload(cls.owner),
+            selectinload(cls.tags),
+        )
+
+    @classmethod
+    def random(cls, *criteria):
+        
+        # Pick a random id between the smallest and largest and take the first
+        # video at or after it, wrapping around to the start. Both lookups are
+        # primary key seeks, where OFFSET would walk up to every row. Ids that
+        # follow a gap are a little more likely to be picked.
+        low, high = db.session.execute(select(func.min(cls.id), func.max(cls.id))).one()
+        if low is None:
+            return None
+        pick = random.randint(low, high)
+        stmt = select(cls).options(*cls.eager_load_options()).where(*criteria).order_by(cls.id).limit(1)
+        video = db.session.execute(stmt.where(cls.id >= pick)).scalar_one_or_none()
+        if video is None:
+            video = db.session.execute(stmt.where(cls.id < pick)).scalar_one_or_none()
+        return video
     
     def set_game(self, game_name):
         
@@ -397,18 +464,106 @@ class Video(db.Model):
     def __repr__(self):
         return "<Video {}>".format(self.video_id)
 
+class FileIdentity(db.Model):
+    __tablename__ = "file_identity"
+
+    id        = db.Column(db.Integer, primary_key=True)
+    path      = db.Column(db.String(2048), unique=True, nullable=False)
+    device    = db.Column(db.BigInteger, nullable=False)
+    inode     = db.Column(db.BigInteger, nullable=False)
+    size      = db.Column(db.BigInteger, nullable=False)
+    mtime_ns  = db.Column(db.BigInteger, nullable=False)
+    video_id  = db.Column(db.String(32), nullable=False)
+    updated_at = db.Column(db.DateTime(), default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    @classmethod
+    def by_path(cls, path=None):
+        
+        # Cached identities keyed by path relative to the video directory
+        stmt = select(cls)
+        if path is not None:
+            stmt = stmt.filter_by(path=path)
+        return {fi.path: fi for fi in db.session.execute(stmt).scalars()}
+
+    def matches(self, stat):
+        return (self.device, self.inode, self.size, self.mtime_ns) == \
+            (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def update_from(self, stat, video_id):
+        self.device = stat.st_dev
+        self.inode = stat.st_ino
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.video_id = video_id
+
+    def __repr__(self):
+        return f"<FileIdentity {self.path} -> {self.video_id}>"
+
+class DirectoryState(db.Model):
+    __tablename__ = "directory_state"
+
+    id       = db.Column(db.Integer, primary_key=True)
+    path     = db.Column(db.String(2048), unique=True, nullable=False)
+    mtime_ns = db.Column(db.BigInteger, nullable=True)
+    files    = db.Column(db.Text, nullable=False, default='[]')
+    subdirs  = db.Column(db.Text, nullable=False, default='[]')
+
+    @classmethod
+    def listings(cls):
+        
+        # {path: (mtime_ns, files, subdirs)} in the shape util.walk_video_files() takes
+        rows = db.session.execute(select(cls.path, cls.mtime_ns, cls.files, cls.subdirs))
+        return {path: (mtime_ns, json.loads(files), json.loads(subdirs)) for path, mtime_ns, files, subdirs in rows}
+
+    @classmethod
+    def save_listings(cls, listings, start=''):
+        
+        # Store the directories visited by a walk from `start` and forget the ones
+        # below it that no longer exist
+        rows = {ds.path: ds for ds in db.session.execute(select(cls)).scalars()}
+        for path, (mtime_ns, files, subdirs) in listings.items():
+            ds = rows.get(path)
+            if ds is None:
+                ds = cls(path=path)
+                db.session.add(ds)
+            ds.mtime_ns = mtime_ns
+            ds.files = json.dumps(files)
+            ds.subdirs = json.dumps(subdirs)
+        prefix = start + '/' if start else ''
+        for path, ds in rows.items():
+            if path not in listings and (not start or path == start or path.startswith(prefix)):
+                db.session.delete(ds)
+
+    def __repr__(self):
+        return f"<DirectoryState {self.path}>"
+
 class VideoInfo(db.Model):
     __tablename__ = "video_info"
+    # The a-z and duration sorts, with video_id to join back to video
+    __table_args__ = (
+        db.Index('ix_video_info_title_video_id', 'title', 'video_id'),
+        db.Index('ix_video_info_duration_video_id', 'duration', 'video_id'),
+    )
 
     id          = db.Column(db.Integer, primary_key=True)
-    video_id    = db.Column(db.String(32), db.ForeignKey("video.video_id"), nullable=False)
-    title       = db.Column(db.String(256), index=True)
+    video_id    = db.Column(db.String(32), db.ForeignKey("video.video_id"), nullable=False, index=True)
+    title       = db.Column(db.String(256))
     description = db.Column(db.String(2048))
     info        = db.Column(db.Text)
     duration    = db.Column(db.Float)
     width       = db.Column(db.Integer)
     height      = db.Column(db.Integer)
     private     = db.Column(db.Boolean, default=False)  # Changed default to False - all videos public by default
+    framerate    = db.Column(db.Float)
+    video_codec  = db.Column(db.String(32))
+    audio_codec  = db.Column(db.String(32))
+    bitrate      = db.Column(db.Integer)
+    pixel_format = db.Column(db.String(32))
+    has_audio    = db.Column(db.Boolean)
+    # ffprobe quarantine for files that can't be read yet, see sync_metadata
+    probe_attempts = db.Column(db.Integer, default=0)
+    probe_retry_at = db.Column(db.DateTime())
+    probe_size     = db.Column(db.BigInteger)
 
     video       = db.relationship("Video", back_populates="info", uselist=False, lazy="joined")
 
@@ -421,16 +576,32 @@ class VideoInfo(db.Model):
     @property
     def acodec(self):
         info = json.loads(self.info) if self.info else None
-        acodec = [i for i in info if i["codec_type"] == "video"][0] if info else None
+        acodec = next((i for i in info if i["codec_type"] == "audio"), None) if info else None
         return acodec
 
-    @property
-    def framerate(self):
-        if self.vcodec:
-            frn, frd = self.vcodec.get("r_frame_rate", "").split("/")
-            return round(float(frn)/float(frd))
-        else:
-            return None
+    def set_media_fields(self, fields):
+        
+        for key, value in fields.items():
+            setattr(self, key, value)
+
+    def probe_due(self, size, now):
+        
+        # Quarantined files are retried once their backoff ends, or straight away if they changed
+        return self.probe_retry_at is None or self.probe_retry_at <= now or self.probe_size != size
+
+    def defer_probe(self, size, retry_at, failed=False):
+        
+        # Failures back off exponentially, files that are still being written just wait
+        if failed:
+            self.probe_attempts = (self.probe_attempts or 0) + 1
+        self.probe_size = size
+        self.probe_retry_at = retry_at
+
+    def clear_probe_quarantine(self):
+        
+        self.probe_attempts = 0
+        self.probe_size = None
+        self.probe_retry_at = None
 
     def json(self):
         return {
@@ -440,7 +611,7 @@ class VideoInfo(db.Model):
             "width": self.width,
             "height": self.height,
             "duration": round(self.duration) if self.duration else 0,
-            "framerate": self.framerate
+            "framerate": round(self.framerate) if self.framerate else None
         }
 
     def __repr__(self):
@@ -455,6 +626,9 @@ class VideoView(db.Model):
     id          = db.Column(db.Integer, primary_key=True)
     video_id    = db.Column(db.String(32), db.ForeignKey("video.video_id"), nullable=False)
     ip_address  = db.Column(db.String(256), nullable=False)
+    # With VIEW_COUNT_MODE=approximate, rows older than VIEW_EXACT_WINDOW_DAYS are
+    # folded into VideoViewSketch and deleted. NULL for views from before this column.
+    created_at  = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
 
     def json(self):
         return {
@@ -465,18 +639,55 @@ class VideoView(db.Model):
     @classmethod
     def count(cls, video_id):
         
+        if current_app.config['VIEW_COUNT_MODE'] == 'approximate':
+            # The view rows only cover the exact window, the counter holds the sketch's estimate
+            stmt = select(Video.view_count).filter_by(video_id=video_id).limit(1)
+            return db.session.execute(stmt).scalar() or 0
         stmt = select(func.count()).select_from(cls).filter_by(video_id=video_id)
         return db.session.execute(stmt).scalar_one()
 
     @classmethod
-    def add_view(cls, video_id, ip_address):
-        
-        stmt = select(cls).filter_by(video_id=video_id, ip_address=ip_address)
-        exists = db.session.execute(stmt).scalar_one_or_none()
+    def record_views(cls, views):
         
-        if not exists:
-            db.session.add(cls(video_id=video_id, ip_address=ip_address))
-            db.session.commit()
+        # Handler for the view buffer: `views` is a list of (video_id, ip_address, hits).
+        # INSERT OR IGNORE against the (video_id, ip_address) unique constraint
+        # skips repeat viewers without a SELECT, and its rowcount says which
+        # views were new.
+        counts = {}
+        added = {}
+        stmt = insert(cls.__table__).prefix_with('OR IGNORE')
+        for video_id, ip_address, _ in views:
+            if db.session.execute(stmt, {'video_id': video_id, 'ip_address': ip_address}).rowcount:
+                counts[video_id] = counts.get(video_id, 0) + 1
+                added.setdefault(video_id, []).append(ip_address)
+        # The analytics buckets count every hit, repeat viewers included. The
+        # buffer dedupes views but counts hits, so this doesn't depend on how
+        # often it flushes.
+        now = datetime.datetime.utcnow()
+        events = {}
+        for video_id, _, hits in views:
+            events[video_id] = events.get(video_id, 0) + hits
+        VideoViewHourly.add_views(events, now)
+        VideoViewDaily.add_views(events, now)
+        if current_app.config['VIEW_COUNT_MODE'] == 'approximate':
+            estimates = VideoViewSketch.add_views(added)
+            for video_id, estimate in estimates.items():
+                stmt = update(Video).where(Video.video_id == video_id).values(
+                    view_count=estimate,
+                    updated_at=Video.updated_at
+                )
+                db.session.execute(stmt)
+            return estimates
+        # Keep the denormalized counter on Video in step with the view rows
+        # so listings never have to COUNT per video.
+        # updated_at is passed through so the onupdate hook doesn't reorder "newest".
+        for video_id, n in counts.items():
+            stmt = update(Video).where(Video.video_id == video_id).values(
+                view_count=func.coalesce(Video.view_count, 0) + n,
+                updated_at=Video.updated_at
+            )
+            db.session.execute(stmt)
+        return counts
 
     def __repr__(self):
         return "<VideoViews {} {}>".format(self.video_id, self.ip_address)
@@ -487,6 +698,224 @@ class ProcessingStatus(enum.Enum):
     COMPLETED = "completed"
     FAILED = "failed"
     
+class ViewBucketMixin:
+    # Views of a video in the period starting at `bucket`, written by
+    # VideoView.record_views so analytics never have to read video_view.
+    video_id    = db.Column(db.String(32), primary_key=True)
+    bucket      = db.Column(db.DateTime, primary_key=True)
+    views       = db.Column(db.Integer, nullable=False, default=0)
+    # 'hour' or 'day', set by each bucket table
+    period      = 'hour'
+
+    @classmethod
+    def bucket_start(cls, at):
+        if cls.period == 'day':
+            return at.replace(hour=0, minute=0, second=0, microsecond=0)
+        return at.replace(minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def add_views(cls, counts, at):
+        
+        # Upsert {video_id: views} into the bucket containing `at`
+        if not counts:
+            return
+        bucket = cls.bucket_start(at)
+        stmt = sqlite_insert(cls.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['video_id', 'bucket'],
+            set_={'views': cls.__table__.c.views + stmt.excluded.views}
+        )
+        db.session.execute(stmt, [{'video_id': video_id, 'bucket': bucket, 'views': views}
+            for video_id, views in counts.items()])
+
+
+class VideoViewHourly(ViewBucketMixin, db.Model):
+    __tablename__ = "video_view_hourly"
+    __table_args__ = (
+        db.Index('ix_video_view_hourly_bucket_video_id', 'bucket', 'video_id'),
+    )
+    period = 'hour'
+
+
+class VideoViewDaily(ViewBucketMixin, db.Model):
+    __tablename__ = "video_view_daily"
+    __table_args__ = (
+        db.Index('ix_video_view_daily_bucket_video_id', 'bucket', 'video_id'),
+    )
+    period = 'day'
+
+
+class VideoViewSketch(db.Model):
+    __tablename__ = "video_view_sketch"
+
+    video_id    = db.Column(db.String(32), db.ForeignKey("video.video_id"), primary_key=True)
+    # hll.HyperLogLog.to_bytes() of every viewer IP seen for the video
+    registers   = db.Column(db.LargeBinary, nullable=False)
+    updated_at  = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    @classmethod
+    def add_views(cls, views):
+        
+        # Merge {video_id: [ip_address, ...]} into the sketches and return the new
+        # estimates. A video without a sketch yet starts from the view rows it
+        # already has, so switching to approximate mode keeps existing counts.
+        from .hll import HyperLogLog
+        if not views:
+            return {}
+        stmt = select(cls).where(cls.video_id.in_(list(views)))
+        sketches = {s.video_id: s for s in db.session.execute(stmt).scalars()}
+        estimates = {}
+        for video_id, ip_addresses in views.items():
+            sketch = sketches.get(video_id)
+            if sketch is None:
+                hll = HyperLogLog()
+                stmt = select(VideoView.ip_address).filter_by(video_id=video_id)
+                hll.update(db.session.execute(stmt).scalars())
+            else:
+                hll = HyperLogLog.from_bytes(sketch.registers)
+            hll.update(ip_addresses)
+            if sketch is None:
+                db.session.add(cls(video_id=video_id, registers=hll.to_bytes()))
+            else:
+                sketch.registers = hll.to_bytes()
+            estimates[video_id] = hll.count()
+        return estimates
+
+    @classmethod
+    def compact(cls, older_than, video_ids):
+        
+        # Delete the view rows of `video_ids` from before `older_than` (or
+        # without a timestamp) and keep them in the sketches. The DELETE comes
+        # first so the transaction holds the write lock before the sketches are read.
+        stale = or_(VideoView.created_at < older_than, VideoView.created_at == None)
+        stmt = (delete(VideoView).where(VideoView.video_id.in_(video_ids), stale)
+            .returning(VideoView.video_id, VideoView.ip_address).execution_options(synchronize_session=False))
+        removed = {}
+        for video_id, ip_address in db.session.execute(stmt):
+            removed.setdefault(video_id, []).append(ip_address)
+        estimates = cls.add_views(removed)
+        for video_id, estimate in estimates.items():
+            db.session.execute(update(Video).where(Video.video_id == video_id).values(
+                view_count=estimate,
+                updated_at=Video.updated_at
+            ))
+        db.session.commit()
+        return sum(len(ips) for ips in removed.values())
+
+
+class VideoScore(db.Model):
+    __tablename__ = "video_score"
+    __table_args__ = (
+        # video_id is the 'trending' sort's tiebreaker
+        db.Index('ix_video_score_score_video_id', 'score', 'video_id'),
+    )
+
+    video_id         = db.Column(db.String(32), db.ForeignKey("video.video_id"), primary_key=True)
+    # Views weighted by age, halving every TRENDING_HALF_LIFE_HOURS, as of computed_through
+    score            = db.Column(db.Float, nullable=False)
+    computed_through = db.Column(db.DateTime, nullable=False)
+
+    @classmethod
+    def refresh(cls, now, half_life_hours, min_score=0.01):
+        
+        # Fold the hourly view buckets completed since the last run into the
+        # scores: decay every score to the new point in time, drop the ones that
+        # have faded away, then add the new views weighted by their own age.
+        through = VideoViewHourly.bucket_start(now)
+        last = db.session.execute(select(func.max(cls.computed_through))).scalar()
+        if last is None:
+            # Start as far back as views still count for, older ones would have been dropped anyway
+            last = through - datetime.timedelta(hours=half_life_hours * math.log2(1 / min_score))
+        if last >= through:
+            return 0
+
+        def weight(at):
+            return 0.5 ** ((through - at).total_seconds() / 3600 / half_life_hours)
+
+        db.session.execute(update(cls).values(score=cls.score * weight(last), computed_through=through))
+        db.session.execute(delete(cls).where(cls.score < min_score))
+
+        scores = {}
+        stmt = select(VideoViewHourly.video_id, VideoViewHourly.bucket, VideoViewHourly.views).where(
+            VideoViewHourly.bucket >= last, VideoViewHourly.bucket < through)
+        for video_id, bucket, views in db.session.execute(stmt):
+            scores[video_id] = scores.get(video_id, 0) + views * weight(bucket + datetime.timedelta(hours=1))
+        if scores:
+            stmt = sqlite_insert(cls.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['video_id'],
+                set_={'score': cls.__table__.c.score + stmt.excluded.score}
+            )
+            db.session.execute(stmt, [{'video_id': video_id, 'score': score, 'computed_through': through}
+                for video_id, score in scores.items()])
+        db.session.commit()
+        return len(scores)
+
+
+class ShuffleSession(db.Model):
+    __tablename__ = "shuffle_session"
+
+    id          = db.Column(db.String(32), primary_key=True)
+    seed        = db.Column(db.BigInteger, nullable=False)
+    total       = db.Column(db.Integer, nullable=False, default=0)
+    created_at  = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+
+    # Rows per INSERT when storing an order
+    INSERT_CHUNK = 5000
+
+    @classmethod
+    def create(cls, video_ids, seed=None, max_age=None):
+        
+        # The same seed over the same videos always gives the same order. It is
+        # stored one row per position, so a page is a primary key range scan.
+        if seed is None:
+            seed = secrets.randbits(32)
+        order = sorted(video_ids)
+        random.Random(seed).shuffle(order)
+        if max_age is not None:
+            cls.delete_older_than(datetime.datetime.utcnow() - max_age)
+        session = cls(id=secrets.token_hex(16), seed=seed, total=len(order))
+        db.session.add(session)
+        db.session.flush()
+        for i in range(0, len(order), cls.INSERT_CHUNK):
+            db.session.execute(insert(ShuffleSessionItem.__table__), [
+                {"session_id": session.id, "position": i + n, "video_id": video_id}
+                for n, video_id in enumerate(order[i:i + cls.INSERT_CHUNK])
+            ])
+        db.session.commit()
+        return session
+
+    @classmethod
+    def delete_older_than(cls, cutoff):
+        
+        # SQLite doesn't enforce foreign keys here, so the items go first
+        expired = select(cls.id).where(cls.created_at < cutoff)
+        db.session.execute(delete(ShuffleSessionItem).where(ShuffleSessionItem.session_id.in_(expired))
+            .execution_options(synchronize_session=False))
+        db.session.execute(delete(cls).where(cls.created_at < cutoff).execution_options(synchronize_session=False))
+
+    def page(self, offset, limit):
+        stmt = (
+            select(ShuffleSessionItem.video_id)
+            .where(
+                ShuffleSessionItem.session_id == self.id,
+                ShuffleSessionItem.position >= offset,
+                ShuffleSessionItem.position < offset + limit
+            )
+            .order_by(ShuffleSessionItem.position)
+        )
+        return db.session.execute(stmt).scalars().all(), self.total
+
+
+class ShuffleSessionItem(db.Model):
+    __tablename__ = "shuffle_session_item"
+
+    session_id  = db.Column(db.String(32), db.ForeignKey("shuffle_session.id", ondelete="CASCADE"), primary_key=True)
+    position    = db.Column(db.Integer, primary_key=True)
+    # Video.id
+    video_id    = db.Column(db.Integer, nullable=False)
+
+
 class VideoProcessingJob(db.Model):
     __tablename__ = "video_processing_job"
     
@@ -495,11 +924,109 @@ class VideoProcessingJob(db.Model):
     status = db.Column(db.String(20), default=ProcessingStatus.QUEUED.value)
     progress = db.Column(db.Integer, default=0)  # 0-100
     error_message = db.Column(db.Text, nullable=True)
+    # What process_video needs, so queued work survives a restart
+    game_name = db.Column(db.String(100), nullable=True)
+    tags = db.Column(db.Text, nullable=True)  # comma-separated
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_video_processing_job_owner_id_user'), nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    claim_token = db.Column(db.String(64), nullable=True, index=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    # host:pid of the worker running the job, which keeps pushing the lease out while it does
+    claimed_by = db.Column(db.String(255), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_video_processing_job_status_id', 'status', 'id'),
+    )
+    
     # Relationships
     video = db.relationship("Video", backref=db.backref("processing_jobs", lazy="dynamic"))
+
+    @classmethod
+    def claim_next(cls, claim_token, claimed_by=None, lease_seconds=300):
+        
+        # A single UPDATE picks and marks the oldest queued job, so two workers
+        # can never claim the same one (SQLite serializes writers).
+        next_id = select(cls.id).where(cls.status == ProcessingStatus.QUEUED.value).order_by(cls.id).limit(1).scalar_subquery()
+        now = datetime.datetime.utcnow()
+        stmt = update(cls).where(cls.id == next_id, cls.status == ProcessingStatus.QUEUED.value).values(
+            status=ProcessingStatus.PROCESSING.value,
+            claim_token=claim_token,
+            claimed_at=now,
+            claimed_by=claimed_by,
+            lease_expires_at=now + datetime.timedelta(seconds=lease_seconds),
+            attempts=func.coalesce(cls.attempts, 0) + 1,
+            updated_at=now
+        ).execution_options(synchronize_session=False)
+        result = db.session.execute(stmt)
+        db.session.commit()
+        if result.rowcount == 0:
+            return None
+        return db.session.execute(select(cls).filter_by(claim_token=claim_token)).scalar_one_or_none()
+
+    @classmethod
+    def renew_leases(cls, job_ids, claimed_by, lease_seconds):
+        
+        # Heartbeat from the worker running these jobs. Only extends leases it
+        # still holds, a job that was requeued meanwhile stays requeued.
+        if not job_ids:
+            return 0
+        renewed = db.session.execute(update(cls).where(
+            cls.id.in_(job_ids),
+            cls.status == ProcessingStatus.PROCESSING.value,
+            cls.claimed_by == claimed_by
+        ).values(
+            lease_expires_at=datetime.datetime.utcnow() + datetime.timedelta(seconds=lease_seconds),
+            updated_at=cls.updated_at
+        ).execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        return renewed
+
+    @classmethod
+    def requeue_stale(cls, expired_before=None, max_attempts=3, job_ids=None):
+        
+        # Jobs left in PROCESSING by a crashed or killed worker go back to the
+        # queue, or fail once they've used up their attempts. Their lease has
+        # run out (no lease at all: claimed before leases existed), or the
+        # caller knows the claiming worker is gone and passes their ids.
+        processing = [cls.status == ProcessingStatus.PROCESSING.value]
+        if expired_before is not None:
+            processing.append(or_(cls.lease_expires_at == None, cls.lease_expires_at < expired_before))
+        if job_ids is not None:
+            processing.append(cls.id.in_(job_ids))
+        failed = db.session.execute(update(cls).where(*processing, cls.attempts >= max_attempts).values(
+            status=ProcessingStatus.FAILED.value,
+            error_message="Processing was interrupted too many times",
+            claim_token=None,
+            claimed_by=None,
+            lease_expires_at=None
+        ).execution_options(synchronize_session=False)).rowcount
+        requeued = db.session.execute(update(cls).where(*processing).values(
+            status=ProcessingStatus.QUEUED.value,
+            claim_token=None,
+            claimed_by=None,
+            lease_expires_at=None
+        ).execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        return requeued, failed
+
+    @classmethod
+    def set_progress(cls, updates):
+        
+        # BatchedWriter handler for (job_id, progress) pairs. Progress only
+        # moves forward, so a late flush can't undo a finished job's 100.
+        # Reporting progress also renews the job's lease.
+        latest = {}
+        for job_id, progress in updates:
+            latest[job_id] = max(progress, latest.get(job_id, 0))
+        for job_id, progress in latest.items():
+            db.session.execute(update(cls).where(cls.id == job_id, func.coalesce(cls.progress, 0) < progress)
+                .values(progress=progress).execution_options(synchronize_session=False))
+        lease = datetime.timedelta(seconds=current_app.config['JOB_LEASE_SECONDS'])
+        db.session.execute(update(cls).where(cls.id.in_(latest), cls.status == ProcessingStatus.PROCESSING.value)
+            .values(lease_expires_at=datetime.datetime.utcnow() + lease).execution_options(synchronize_session=False))
     
     def json(self):
         return {
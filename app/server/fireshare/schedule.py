@@ -12,9 +12,21 @@ def fireshare_scan():
     logger.info('Starting scheduled scan...')
     Popen("fireshare bulk-import", shell=True)
 
+def fireshare_compact_views():
+    logger.info('Starting scheduled view compaction...')
+    Popen("fireshare compact-views", shell=True)
+
+def fireshare_compute_trending():
+    logger.info('Starting scheduled trending score update...')
+    Popen("fireshare compute-trending", shell=True)
+
 def init_schedule(dburl, mins_between_scan=5):
+    scheduler = BackgroundScheduler(jobstores={'default': SQLAlchemyJobStore(url=dburl)})
     if mins_between_scan > 0:
         logger.info(f'Initializing scheduled video scan. minutes={mins_between_scan}')
-        scheduler = BackgroundScheduler(jobstores={'default': SQLAlchemyJobStore(url=dburl)})
         scheduler.add_job(fireshare_scan, 'interval', minutes=mins_between_scan, id='fireshare_scan', replace_existing=True)
-        scheduler.start()
+    logger.info('Initializing daily view compaction')
+    scheduler.add_job(fireshare_compact_views, 'interval', hours=24, id='fireshare_compact_views', replace_existing=True)
+    logger.info('Initializing hourly trending score update')
+    scheduler.add_job(fireshare_compute_trending, 'interval', hours=1, id='fireshare_compute_trending', replace_existing=True)
+    scheduler.start()
@@ -1,10 +1,13 @@
 import os
+import fnmatch
 from pathlib import Path
 import json
 import subprocess as sp
 import xxhash
 from fireshare import logger
+from fireshare.constants import SUPPORTED_FILE_EXTENSIONS
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 def lock_exists(path: Path):
     
@@ -42,11 +45,168 @@ def get_media_info(path):
         logger.warning('Could not extract video info')
         return None
 
-def create_poster(video_path, out_path, second=0):
+def _parse_frame_rate(rate):
+    try:
+        frn, frd = str(rate).split("/")
+        return float(frn) / float(frd) if float(frd) else None
+    except (ValueError, TypeError):
+        return None
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+def extract_media_fields(streams):
+    """
+    Pull the typed VideoInfo columns out of the ffprobe stream list so nothing
+    downstream has to parse the stored JSON again.
+    """
+    vcodec = next((i for i in streams if i.get('codec_type') == 'video'), None)
+    acodec = next((i for i in streams if i.get('codec_type') == 'audio'), None)
+    if vcodec is None:
+        return None
+
+    duration = 0
+    if 'duration' in vcodec:
+        duration = float(vcodec['duration'])
+    elif 'tags' in vcodec and 'DURATION' in vcodec['tags']:
+        duration = dur_string_to_seconds(vcodec['tags']['DURATION'])
+
+    return {
+        'duration': duration,
+        'width': _int_or_none(vcodec.get('width')) or 0,
+        'height': _int_or_none(vcodec.get('height')) or 0,
+        'framerate': _parse_frame_rate(vcodec.get('r_frame_rate')),
+        'video_codec': vcodec.get('codec_name'),
+        'audio_codec': acodec.get('codec_name') if acodec else None,
+        'bitrate': _int_or_none(vcodec.get('bit_rate')),
+        'pixel_format': vcodec.get('pix_fmt'),
+        'has_audio': acodec is not None,
+    }
+
+# Directories modified this recently are relisted on the next walk, since a
+# coarse filesystem timestamp can't tell apart two changes within the same tick
+DIRECTORY_MTIME_SLACK_NS = 2 * 10**9
+
+def is_ignored(rel_path, patterns):
+    name = os.path.basename(rel_path)
+    return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel_path, p) for p in patterns)
+
+def _list_directory(path):
+    files, subdirs = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                # Like Path.glob('**'), don't descend into symlinked directories
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif os.path.splitext(entry.name)[1].lower() in SUPPORTED_FILE_EXTENSIONS and entry.is_file():
+                    files.append(entry.name)
+            except OSError:
+                continue
+    return sorted(files), sorted(subdirs)
+
+def walk_video_files(base, start='', listings=None, ignore_patterns=()):
+    """
+    Find the video files under base/start with os.scandir, returning their paths
+    relative to base and the listing of every directory visited.
+
+    `listings` maps a directory (relative to base) to the (mtime_ns, files, subdirs)
+    recorded by a previous walk. A directory whose mtime hasn't changed still has
+    the same entries, so its cached listing is reused instead of being read again;
+    only its subdirectories are stat()ed, as their contents can change without
+    touching the parent. Entries matching an fnmatch pattern in ignore_patterns,
+    by name or relative path, are skipped along with everything below them.
+    """
+    listings = listings or {}
+    now = time.time_ns()
+    files, visited = [], {}
+    stack = [start]
+    while stack:
+        rel = stack.pop()
+        full = os.path.join(base, rel) if rel else str(base)
+        try:
+            mtime = os.stat(full).st_mtime_ns
+        except OSError as ex:
+            logger.warning(f"Unable to read directory {full}: {ex}")
+            continue
+        cached = listings.get(rel)
+        if cached and cached[0] is not None and cached[0] == mtime:
+            names, subdirs = cached[1], cached[2]
+        else:
+            try:
+                names, subdirs = _list_directory(full)
+            except OSError as ex:
+                logger.warning(f"Unable to read directory {full}: {ex}")
+                continue
+        visited[rel] = (mtime if now - mtime > DIRECTORY_MTIME_SLACK_NS else None, names, subdirs)
+        for name in names:
+            path = os.path.join(rel, name)
+            if not is_ignored(path, ignore_patterns):
+                files.append(path)
+        for name in subdirs:
+            path = os.path.join(rel, name)
+            if not is_ignored(path, ignore_patterns):
+                stack.append(path)
+    return files, visited
+
+def run_parallel(func, items, jobs=None):
+    """
+    Call func(item) for every item on a pool of `jobs` threads (default: one per
+    CPU) and yield (item, result) pairs as they finish. The work here is waiting
+    on ffmpeg/ffprobe subprocesses, so threads are enough to keep every core busy.
+    Results come back to the calling thread, which should do any database writes.
+    """
+    jobs = max(1, jobs or os.cpu_count() or 1)
+    if jobs == 1 or len(items) <= 1:
+        for item in items:
+            yield item, func(item)
+        return
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(func, item): item for item in items}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+def poster_options(config):
+    """
+    create_poster() keyword arguments for the POSTER_* settings in the app config.
+    """
+    return {
+        'accurate': config.get('POSTER_SEEK_MODE') == 'accurate',
+        'quality': config.get('POSTER_QUALITY'),
+        'max_width': config.get('POSTER_MAX_WIDTH'),
+    }
+
+def create_poster(video_path, out_path, second=0, accurate=False, quality=None, max_width=None):
+    """
+    Write a single frame from `second` into the video to out_path.
+
+    `-ss` goes before `-i` so ffmpeg seeks the input straight to the nearest
+    keyframe rather than decoding every frame up to `second`. By default that
+    keyframe is used as is; with accurate=True ffmpeg decodes on from it to the
+    exact timestamp, which costs at most one GOP. quality is passed through as
+    -q:v and max_width scales larger frames down.
+    """
     s = time.time()
-    cmd = ['ffmpeg', '-v', 'quiet', '-y', '-i', str(video_path), '-ss', str(second), '-vframes', '1', str(out_path)]
+    before = os.stat(out_path).st_mtime_ns if os.path.exists(out_path) else None
+    cmd = ['ffmpeg', '-v', 'quiet', '-y', '-ss', str(second)]
+    if not accurate:
+        cmd.append('-noaccurate_seek')
+    cmd += ['-i', str(video_path), '-frames:v', '1']
+    if max_width:
+        cmd += ['-vf', f"scale='min({int(max_width)},iw)':-2"]
+    if quality is not None:
+        cmd += ['-q:v', str(quality)]
+    cmd.append(str(out_path))
     logger.debug(f"$ {' '.join(cmd)}")
     sp.call(cmd)
+    written = os.path.exists(out_path) and os.stat(out_path).st_mtime_ns != before
+    if not written and second:
+        # Seeking past the last keyframe yields no frame, fall back to the start of the video
+        logger.warning(f'No frame found at {second}s in {str(video_path)}, using the first frame')
+        return create_poster(video_path, out_path, 0, accurate, quality, max_width)
     e = time.time()
     logger.info(f'Generated poster {str(out_path)} in {e-s}s')
 
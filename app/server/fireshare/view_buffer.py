@@ -0,0 +1,98 @@
+import os
+import atexit
+import logging
+import threading
+
+from .db_config import writer
+
+logger = logging.getLogger('fireshare')
+
+# A shared link going viral means a burst of view POSTs, mostly repeats from the
+# same viewers. They are collected here and written in batches rather than one
+# SELECT + INSERT + COMMIT each.
+
+
+class ViewBuffer:
+    """
+    Collects (video_id, ip_address) views in memory, deduplicated but with a
+    count of how many times each was seen, and writes them with
+    VideoView.record_views every `flush_interval` seconds, or sooner once
+    `flush_size` distinct views are pending. At most `max_pending` are held:
+    past that (the database has stopped accepting writes) new views are
+    dropped. Whatever is pending is flushed when the process exits.
+    """
+
+    def __init__(self, flush_interval=5.0, flush_size=500, max_pending=50000):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._dropped = 0
+        self._atexit = False
+
+    def init_app(self, app):
+        self.flush_interval = app.config['VIEW_FLUSH_SECONDS']
+        self.flush_size = app.config['VIEW_FLUSH_SIZE']
+        self.max_pending = app.config['VIEW_BUFFER_MAX']
+        if not self._atexit:
+            atexit.register(self.flush)
+            self._atexit = True
+
+    def _start(self):
+        # Started lazily, and again in a forked child, which inherits the parent's pending views but not the thread
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pending = {}
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='fireshare-views', daemon=True).start()
+
+    def add(self, video_id, ip_address):
+        if self.flush_interval <= 0:
+            self._write({(video_id, ip_address): 1})
+            return
+        if self._pid != os.getpid():
+            self._start()
+        with self._lock:
+            key = (video_id, ip_address)
+            if key not in self._pending and len(self._pending) >= self.max_pending:
+                self._dropped += 1
+                return
+            self._pending[key] = self._pending.get(key, 0) + 1
+            full = len(self._pending) >= self.flush_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            views, self._pending = self._pending, {}
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            logger.warning(f"View buffer was full, {dropped} view(s) were not recorded")
+        if views and not self._write(views):
+            # Keep them for the next flush, as far as there is room
+            with self._lock:
+                for key, hits in views.items():
+                    if key in self._pending:
+                        self._pending[key] += hits
+                    elif len(self._pending) < self.max_pending:
+                        self._pending[key] = hits
+
+    def _write(self, views):
+        from .models import VideoView
+        return writer.write(VideoView.record_views, [(video_id, ip_address, hits)
+            for (video_id, ip_address), hits in views.items()])
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+view_buffer = ViewBuffer()
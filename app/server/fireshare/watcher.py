@@ -0,0 +1,325 @@
+import os
+import errno
+import select
+import signal
+import struct
+import threading
+import time
+import ctypes
+import ctypes.util
+import logging
+from pathlib import Path
+from flask import current_app
+from sqlalchemy import or_, update, delete
+
+from . import db, util
+from .constants import SUPPORTED_FILE_EXTENSIONS
+from .models import Video, FileIdentity
+
+logger = logging.getLogger('fireshare.watcher')
+
+# `fireshare watch` follows VIDEO_DIRECTORY with inotify and ingests files as
+# they settle, so new clips show up in seconds. The scheduled bulk-import keeps
+# running at a low frequency to reconcile anything the watcher missed.
+
+# From <sys/inotify.h>
+IN_MODIFY      = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ONLYDIR     = 0x01000000
+IN_ISDIR       = 0x40000000
+IN_NONBLOCK    = os.O_NONBLOCK
+IN_CLOEXEC     = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    """
+    Minimal inotify binding over libc with ctypes, so watching needs no extra
+    dependency. Watches are tracked by directory path relative to `base`.
+    """
+
+    def __init__(self, base):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "inotify is not available on this platform")
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.base = str(base)
+        self.dirs = {}
+        self.wds = {}
+
+    def add_watch(self, rel):
+        wd = self._add_watch(self.fd, os.fsencode(os.path.join(self.base, rel)), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), os.path.join(self.base, rel))
+        self.dirs[wd] = rel
+        self.wds[rel] = wd
+
+    def forget(self, rel):
+        # Drop the watches on rel and everything below it
+        prefix = rel + '/'
+        for path in [p for p in self.wds if p == rel or p.startswith(prefix)]:
+            wd = self.wds.pop(path)
+            self.dirs.pop(wd, None)
+            self._rm_watch(self.fd, wd)
+
+    def renamed(self, old, new):
+        # Re-key watches after a directory moved within the tree, the kernel keeps them
+        prefix = old + '/'
+        for path in [p for p in self.wds if p == old or p.startswith(prefix)]:
+            wd = self.wds.pop(path)
+            self.wds[new + path[len(old):]] = wd
+            self.dirs[wd] = new + path[len(old):]
+
+    def read(self, timeout):
+        """
+        Wait up to `timeout` seconds and return the pending events as
+        (directory, name, mask, cookie) tuples.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((self.dirs.get(wd), name, mask, cookie))
+            if mask & IN_IGNORED:
+                rel = self.dirs.pop(wd, None)
+                if rel is not None and self.wds.get(rel) == wd:
+                    del self.wds[rel]
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _is_video(path):
+    return os.path.splitext(path)[1].lower() in SUPPORTED_FILE_EXTENSIONS
+
+
+def _under(column, path):
+    return or_(column == path, column.startswith(path + '/'))
+
+
+def mark_removed(path):
+    """
+    Mark the videos at `path`, or anywhere below it if it was a directory, as
+    unavailable and forget their cached file identities.
+    """
+    count = db.session.execute(update(Video).where(_under(Video.path, path), Video.available == True)
+        .values(available=False, updated_at=Video.updated_at)
+        .execution_options(synchronize_session=False)).rowcount
+    db.session.execute(delete(FileIdentity).where(_under(FileIdentity.path, path))
+        .execution_options(synchronize_session=False))
+    db.session.commit()
+    if count:
+        logger.info(f"Marked {count} video(s) at {path} unavailable")
+
+
+def move_videos(old, new):
+    """
+    Follow a file or directory renamed within the video directory: update the
+    stored paths and re-point the video_links symlinks at the new location.
+    """
+    paths = current_app.config['PATHS']
+    stmt = db.select(Video).where(_under(Video.path, old))
+    moved = db.session.execute(stmt).scalars().all()
+    for video in moved:
+        video.path = new + video.path[len(old):]
+        src = (paths["video"] / video.path).absolute()
+        dst = paths["processed"] / "video_links" / (video.video_id + video.extension)
+        tmp = dst.with_name(dst.name + '.tmp')
+        try:
+            if tmp.is_symlink():
+                tmp.unlink()
+            os.symlink(src, tmp)
+            os.replace(tmp, dst)
+        except OSError as ex:
+            logger.warning(f"Could not re-link {dst} to {src}: {ex}")
+    stmt = db.select(FileIdentity).where(_under(FileIdentity.path, old))
+    for fi in db.session.execute(stmt).scalars():
+        fi.path = new + fi.path[len(old):]
+    db.session.commit()
+    if moved:
+        logger.info(f"Moved {len(moved)} video(s) from {old} to {new}")
+    return len(moved)
+
+
+class VideoWatcher:
+    """
+    Turn inotify events under `base` into calls to `ingest(path)` for video
+    files that have stopped changing, and to mark_removed() / move_videos() for
+    deletes and renames. Paths are relative to `base`.
+
+    A file is ingested once no event has been seen for it for `debounce` seconds
+    and its size has then stayed the same for `stable_seconds`, so recordings
+    and copies that are still being written are left alone until they finish.
+    """
+
+    def __init__(self, base, ingest, reconcile, ignore_patterns=(), debounce=2.0, stable_seconds=10.0):
+        self.base = Path(base)
+        self.ingest = ingest
+        self.reconcile = reconcile
+        self.ignore_patterns = ignore_patterns
+        self.debounce = debounce
+        self.stable_seconds = stable_seconds
+        self.inotify = Inotify(base)
+        # path -> [last event time, last seen size, time the size was first seen]
+        self.pending = {}
+
+    def watch_tree(self, rel=''):
+        """
+        Watch rel and every directory below it. Returns the video files found,
+        which is how files that arrive inside a new directory get picked up.
+        """
+        found = []
+        stack = [rel]
+        while stack:
+            current = stack.pop()
+            try:
+                self.inotify.add_watch(current)
+                entries = list(os.scandir(os.path.join(self.base, current)))
+            except OSError as ex:
+                if ex.errno == errno.ENOSPC:
+                    logger.error("Ran out of inotify watches, raise fs.inotify.max_user_watches to watch the whole video directory")
+                else:
+                    logger.warning(f"Unable to watch {os.path.join(self.base, current)}: {ex}")
+                continue
+            for entry in entries:
+                path = os.path.join(current, entry.name)
+                if util.is_ignored(path, self.ignore_patterns):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(path)
+                elif _is_video(path):
+                    found.append(path)
+        return found
+
+    def touch(self, path, now):
+        state = self.pending.setdefault(path, [now, None, now])
+        state[0] = now
+
+    def handle(self, events, now):
+        moved_from = {}
+        for directory, name, mask, cookie in events:
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("inotify queue overflowed, events were lost. Running a full scan")
+                self.reconcile()
+                continue
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if util.is_ignored(path, self.ignore_patterns):
+                continue
+            is_dir = bool(mask & IN_ISDIR)
+
+            if mask & IN_MOVED_FROM:
+                moved_from[cookie] = (path, is_dir)
+            elif mask & IN_MOVED_TO and cookie in moved_from:
+                old, _ = moved_from.pop(cookie)
+                if is_dir:
+                    self.inotify.renamed(old, path)
+                else:
+                    self.pending.pop(old, None)
+                if move_videos(old, path) == 0 and not is_dir and _is_video(path):
+                    self.touch(path, now)
+            elif is_dir and mask & (IN_CREATE | IN_MOVED_TO):
+                for found in self.watch_tree(path):
+                    self.touch(found, now)
+            elif is_dir and mask & IN_DELETE:
+                mark_removed(path)
+            elif not is_dir and _is_video(path):
+                if mask & IN_DELETE:
+                    self.pending.pop(path, None)
+                    mark_removed(path)
+                elif mask & (IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO):
+                    self.touch(path, now)
+
+        # Moved out of the watched tree, so no matching IN_MOVED_TO will come
+        for path, is_dir in moved_from.values():
+            if is_dir:
+                self.inotify.forget(path)
+            else:
+                self.pending.pop(path, None)
+            mark_removed(path)
+
+    def settle(self, now):
+        # Ingest the pending files that have stopped changing
+        if self.pending and util.lock_exists(current_app.config['PATHS']['data']):
+            # A bulk import is running and will pick these up or be followed by us
+            return
+        for path, state in list(self.pending.items()):
+            last_event, size, size_since = state
+            if now - last_event < self.debounce:
+                continue
+            try:
+                current = os.stat(self.base / path).st_size
+            except OSError:
+                del self.pending[path]
+                continue
+            if current != size:
+                state[1], state[2] = current, now
+                continue
+            if now - size_since < self.stable_seconds:
+                continue
+            del self.pending[path]
+            try:
+                self.ingest(path)
+            except Exception as ex:
+                logger.error(f"Failed to ingest {path}: {ex}")
+                db.session.rollback()
+
+    def run(self, stopping):
+        while not stopping.is_set():
+            events = self.inotify.read(timeout=1.0)
+            now = time.time()
+            if events:
+                self.handle(events, now)
+            self.settle(now)
+        self.inotify.close()
+
+
+def run_watcher(ingest, reconcile, debounce=2.0, stable_seconds=10.0, initial_scan=True):
+    """
+    Watch VIDEO_DIRECTORY until SIGTERM or SIGINT. Must be called inside an app
+    context. `ingest(path)` imports one settled file and `reconcile()` runs a
+    full scan, used at startup and whenever inotify drops events.
+    """
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    watcher = VideoWatcher(current_app.config['PATHS']['video'], ingest, reconcile,
+        current_app.config['SCAN_IGNORE_PATTERNS'], debounce, stable_seconds)
+    watcher.watch_tree()
+    logger.info(f"Watching {len(watcher.inotify.wds):,} directories under {watcher.base} for changes")
+    # Watches are in place before the scan, so nothing that lands during it is missed
+    if initial_scan:
+        reconcile()
+    watcher.run(stopping)
+    logger.info("Video directory watcher stopped")
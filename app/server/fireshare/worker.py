@@ -1,19 +1,27 @@
 import os
 import json
+import signal
+import socket
+import time
+import uuid
 import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 import datetime
+from flask import current_app, has_app_context
 
 from . import create_app, db, util
+from .db_config import writer
 from .models import Video, VideoInfo, Game, Tag, VideoProcessingJob, ProcessingStatus
 
 logger = logging.getLogger('fireshare.worker')
 
-# In a production implementation, this would use Redis Queue (RQ)
-# For now, we'll implement a simple direct processing function
-# that can be called from the upload endpoint
+# Uploads are queued as VideoProcessingJob rows and processed by `fireshare worker`,
+# which claims them one at a time and runs process_video in a process pool.
 
-def process_video(video_id, game_name, tags=None, owner_id=None):
+def process_video(video_id, game_name, tags=None, owner_id=None, job_id=None):
     """
     Process a video after upload, handling thumbnails, metadata, etc.
     
@@ -22,19 +30,24 @@ def process_video(video_id, game_name, tags=None, owner_id=None):
         game_name: The game to associate with the video
         tags: Optional comma-separated list of tags to apply
         owner_id: Optional user ID of the owner
+        job_id: Optional ID of the claimed job (otherwise looked up by video)
     """
-    app = create_app()
+    app = current_app._get_current_object() if has_app_context() else create_app(web=False)
     with app.app_context():
         try:
             # Mark job as processing
-            stmt = db.select(VideoProcessingJob).filter_by(video_id=video_id)
-            job = db.session.execute(stmt).scalar_one_or_none()
+            if job_id:
+                job = db.session.get(VideoProcessingJob, job_id)
+            else:
+                stmt = db.select(VideoProcessingJob).filter_by(video_id=video_id)
+                job = db.session.execute(stmt).scalars().first()
             
             if not job:
                 logger.error(f"No processing job found for video {video_id}")
                 return {"success": False, "video_id": video_id, "error": "No processing job found"}
                 
             job.status = ProcessingStatus.PROCESSING.value
+            job.lease_expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=app.config['JOB_LEASE_SECONDS'])
             db.session.commit()
             logger.info(f"Processing started for video {video_id}")
             
@@ -48,8 +61,7 @@ def process_video(video_id, game_name, tags=None, owner_id=None):
                 raise ValueError(f"Video {video_id} not found")
             
             # Update progress - 25%
-            job.progress = 25
-            db.session.commit()
+            writer.submit(VideoProcessingJob.set_progress, (job.id, 25))
             
             # Set game
             if game_name:
@@ -60,8 +72,7 @@ def process_video(video_id, game_name, tags=None, owner_id=None):
                     logger.error(f"Error setting game for video {video_id}: {str(e)}")
             
             # Update progress - 50%
-            job.progress = 50
-            db.session.commit()
+            writer.submit(VideoProcessingJob.set_progress, (job.id, 50))
             
             # Add tags
             if tags:
@@ -75,8 +86,7 @@ def process_video(video_id, game_name, tags=None, owner_id=None):
                             logger.error(f"Error adding tag '{tag_name}' to video {video_id}: {str(e)}")
             
             # Update progress - 75%
-            job.progress = 75
-            db.session.commit()
+            writer.submit(VideoProcessingJob.set_progress, (job.id, 75))
             
             # Set owner
             if owner_id:
@@ -132,7 +142,7 @@ def process_video(video_id, game_name, tags=None, owner_id=None):
                 # Create poster
                 try:
                     logger.info(f"Creating poster for video {video_id} at position {poster_time}s with path: {poster_path}")
-                    util.create_poster(video_link_path, poster_path, poster_time)
+                    util.create_poster(video_link_path, poster_path, poster_time, **util.poster_options(app.config))
                     
                     # Verify the poster was created
                     if poster_path.exists():
@@ -169,18 +179,10 @@ def process_video(video_id, game_name, tags=None, owner_id=None):
                 try:
                     logger.info(f"Extracting metadata for video {video_id}")
                     media_info = util.get_media_info(video_link_path)
-                    if media_info:
+                    fields = util.extract_media_fields(media_info) if media_info else None
+                    if fields:
                         info.info = json.dumps(media_info)
-                        vcodec = [i for i in media_info if i['codec_type'] == 'video'][0]
-                        if 'duration' in vcodec:
-                            info.duration = float(vcodec['duration'])
-                        elif 'tags' in vcodec and 'DURATION' in vcodec['tags']:
-                            info.duration = util.dur_string_to_seconds(vcodec['tags']['DURATION'])
-                        else:
-                            info.duration = 0
-                            
-                        info.width = int(vcodec.get('width', 0))
-                        info.height = int(vcodec.get('height', 0))
+                        info.set_media_fields(fields)
                         db.session.commit()
                         logger.info(f"Updated metadata for video {video_id}: {info.duration}s, {info.width}x{info.height}")
                 except Exception as e:
@@ -198,7 +200,7 @@ def process_video(video_id, game_name, tags=None, owner_id=None):
             logger.error(f"Error processing video {video_id}: {str(e)}")
             # Try to update job status if possible
             try:
-                job = VideoProcessingJob.query.filter_by(video_id=video_id).first()
+                job = db.session.get(VideoProcessingJob, job_id) if job_id else VideoProcessingJob.query.filter_by(video_id=video_id).first()
                 if job:
                     job.status = ProcessingStatus.FAILED.value
                     job.error_message = str(e)
@@ -206,4 +208,123 @@ def process_video(video_id, game_name, tags=None, owner_id=None):
             except:
                 pass
             
-            return {"success": False, "video_id": video_id, "error": str(e)}
\ No newline at end of file
+            return {"success": False, "video_id": video_id, "error": str(e)}
+
+
+_pool_app = None
+
+def _init_pool_process():
+    # Each pool process builds its app once and reuses it for every job it runs
+    global _pool_app
+    # Undo the parent's stop handlers: the parent decides when the pool stops
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _pool_app = create_app(web=False)
+
+def run_job(job_id):
+    """
+    Pool entry point: run one already-claimed job.
+    """
+    with _pool_app.app_context():
+        job = db.session.get(VideoProcessingJob, job_id)
+        if not job:
+            logger.error(f"Claimed job {job_id} no longer exists")
+            return {"success": False, "error": "Job not found"}
+        return process_video(job.video_id, job.game_name, job.tags, job.owner_id, job_id=job.id)
+
+def _pid_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _orphaned_job_ids(worker_id):
+    # Jobs claimed by a worker on this host that has since exited. Its pid may
+    # have been reused, possibly by us, which is fine: we haven't claimed anything yet.
+    host = worker_id.rsplit(':', 1)[0]
+    stmt = db.select(VideoProcessingJob.id, VideoProcessingJob.claimed_by).where(
+        VideoProcessingJob.status == ProcessingStatus.PROCESSING.value,
+        VideoProcessingJob.claimed_by.like(f"{host}:%"))
+    orphaned = []
+    for job_id, claimed_by in db.session.execute(stmt):
+        pid = claimed_by.rsplit(':', 1)[1]
+        if not pid.isdigit() or claimed_by == worker_id or not _pid_running(int(pid)):
+            orphaned.append(job_id)
+    return orphaned
+
+def run_worker(concurrency=2, poll_interval=2.0, max_attempts=3):
+    """
+    Claim queued jobs and run up to `concurrency` of them at once until SIGTERM or
+    SIGINT, then let running jobs finish. Must be called inside an app context.
+
+    Each claim holds a lease of JOB_LEASE_SECONDS that the worker keeps renewing
+    while the job runs. Jobs whose lease ran out, and at startup jobs claimed by
+    a worker on this host that is no longer running, are re-queued; jobs other
+    live workers are running are left alone. A job that keeps getting
+    interrupted is failed after `max_attempts` claims.
+    """
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    lease_seconds = current_app.config['JOB_LEASE_SECONDS']
+    # Renew well before expiry, so one slow write doesn't cost a running job its lease
+    renew_interval = max(lease_seconds / 3, poll_interval)
+
+    requeued, failed = VideoProcessingJob.requeue_stale(job_ids=_orphaned_job_ids(worker_id), max_attempts=max_attempts)
+    expired = VideoProcessingJob.requeue_stale(expired_before=datetime.datetime.utcnow(), max_attempts=max_attempts)
+    requeued, failed = requeued + expired[0], failed + expired[1]
+    if requeued or failed:
+        logger.info(f"Recovered interrupted jobs: {requeued} re-queued, {failed} failed")
+    logger.info(f"Video processing worker {worker_id} started with concurrency={concurrency}")
+
+    last_sweep = last_renew = time.time()
+    while not stopping.is_set():
+        inflight = {}
+        with ProcessPoolExecutor(max_workers=concurrency, initializer=_init_pool_process) as pool:
+            broken = False
+            while not broken and (inflight or not stopping.is_set()):
+                while not stopping.is_set() and len(inflight) < concurrency:
+                    job = VideoProcessingJob.claim_next(uuid.uuid4().hex, claimed_by=worker_id, lease_seconds=lease_seconds)
+                    if not job:
+                        break
+                    logger.info(f"Claimed job {job.id} for video {job.video_id} (attempt {job.attempts})")
+                    inflight[pool.submit(run_job, job.id)] = job.id
+                    db.session.expunge(job)
+
+                if inflight and time.time() - last_renew > renew_interval:
+                    # Covers long ffmpeg runs, during which a job reports no progress
+                    VideoProcessingJob.renew_leases(list(inflight.values()), worker_id, lease_seconds)
+                    last_renew = time.time()
+
+                if time.time() - last_sweep > 60:
+                    requeued, failed = VideoProcessingJob.requeue_stale(expired_before=datetime.datetime.utcnow(), max_attempts=max_attempts)
+                    if requeued or failed:
+                        logger.warning(f"Jobs with expired leases: {requeued} re-queued, {failed} failed")
+                    last_sweep = time.time()
+
+                if not inflight:
+                    stopping.wait(poll_interval)
+                    continue
+                done, _ = wait(inflight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = inflight.pop(future)
+                    try:
+                        result = future.result()
+                        if not result.get("success"):
+                            logger.warning(f"Job for video {result.get('video_id')} failed: {result.get('error')}")
+                    except BrokenProcessPool:
+                        # A pool process died mid-job. Put the job back (or fail it if
+                        # it keeps killing workers) and start a fresh pool.
+                        logger.error(f"A processing worker died while running job {job_id}, restarting the pool")
+                        VideoProcessingJob.requeue_stale(job_ids=[job_id], max_attempts=max_attempts)
+                        broken = True
+                    except Exception as e:
+                        logger.error(f"Unexpected error running job {job_id}: {str(e)}")
+            if broken and inflight:
+                VideoProcessingJob.requeue_stale(job_ids=list(inflight.values()), max_attempts=max_attempts)
+    logger.info("Video processing worker stopped")
@@ -39,6 +39,16 @@ else
     echo "Using standard HTTP configuration"
 fi
 
+# The API only hands file delivery to nginx (X-Accel-Redirect) when the installed
+# config has the internal /_accel/ locations from prod.conf, otherwise those
+# responses would reach the client as empty 200s
+if [ "$ENABLE_ACCEL_REDIRECT" = "true" ]; then
+    if ! grep -q "location /_accel/ " /etc/nginx/nginx.conf || ! grep -q "location /_accel/video_links/ " /etc/nginx/nginx.conf; then
+        echo "WARN: nginx config has no /_accel/ locations, disabling ENABLE_ACCEL_REDIRECT"
+        export ENABLE_ACCEL_REDIRECT=false
+    fi
+fi
+
 # Start nginx
 nginx -g 'daemon on;'
 
@@ -115,5 +125,13 @@ if ! runuser -u appuser -- flask db upgrade; then
     runuser -u appuser -- flask db upgrade || true
 fi
 
+echo "Starting video processing worker..."
+runuser -u appuser -- fireshare worker &
+
+if [ "$ENABLE_WATCH" = "true" ]; then
+    echo "Starting video directory watcher..."
+    runuser -u appuser -- fireshare watch &
+fi
+
 echo "Starting Fireshare application..."
 gunicorn --bind=127.0.0.1:5000 "fireshare:create_app(init_schedule=True)" --user appuser --group appuser --workers 3 --threads 3 --preload
@@ -0,0 +1,28 @@
+"""add ffprobe quarantine columns to video_info
+
+Revision ID: 13d628ad33cc
+Revises: 72fbbda0f74b
+Create Date: 2026-10-17 14:05:31.662190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '13d628ad33cc'
+down_revision = '72fbbda0f74b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('video_info', sa.Column('probe_attempts', sa.Integer(), nullable=True, server_default='0'))
+    op.add_column('video_info', sa.Column('probe_retry_at', sa.DateTime(), nullable=True))
+    op.add_column('video_info', sa.Column('probe_size', sa.BigInteger(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('video_info', 'probe_size')
+    op.drop_column('video_info', 'probe_retry_at')
+    op.drop_column('video_info', 'probe_attempts')
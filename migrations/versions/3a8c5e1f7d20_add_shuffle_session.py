@@ -0,0 +1,32 @@
+"""add shuffle_session
+
+Revision ID: 3a8c5e1f7d20
+Revises: 9f3d7b2e6c14
+Create Date: 2026-10-17 19:21:44.730518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a8c5e1f7d20'
+down_revision = '9f3d7b2e6c14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('shuffle_session',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('seed', sa.BigInteger(), nullable=False),
+        sa.Column('video_ids', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_shuffle_session_created_at'), 'shuffle_session', ['created_at'])
+
+
+def downgrade():
+    op.drop_index(op.f('ix_shuffle_session_created_at'), table_name='shuffle_session')
+    op.drop_table('shuffle_session')
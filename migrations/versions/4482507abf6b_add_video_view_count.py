@@ -0,0 +1,33 @@
+"""add denormalized view_count to video
+
+Revision ID: 4482507abf6b
+Revises: 8d5036992141
+Create Date: 2026-10-17 09:12:41.532117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4482507abf6b'
+down_revision = '8d5036992141'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('video', sa.Column('view_count', sa.Integer(), nullable=True, server_default='0'))
+    op.create_index(op.f('ix_video_view_count'), 'video', ['view_count'])
+
+    # Backfill the counter from the existing view rows
+    conn = op.get_bind()
+    conn.execute(sa.text(
+        "UPDATE video SET view_count = "
+        "(SELECT COUNT(*) FROM video_view WHERE video_view.video_id = video.video_id)"
+    ))
+
+
+def downgrade():
+    op.drop_index(op.f('ix_video_view_count'), table_name='video')
+    op.drop_column('video', 'view_count')
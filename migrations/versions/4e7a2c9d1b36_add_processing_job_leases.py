@@ -0,0 +1,28 @@
+"""add worker leases to processing jobs
+
+Revision ID: 4e7a2c9d1b36
+Revises: c71e4d2b8a95
+Create Date: 2026-10-17 21:12:40.318024
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e7a2c9d1b36'
+down_revision = 'c71e4d2b8a95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('video_processing_job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('claimed_by', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('video_processing_job', schema=None) as batch_op:
+        batch_op.drop_column('lease_expires_at')
+        batch_op.drop_column('claimed_by')
@@ -0,0 +1,35 @@
+"""add video_view_sketch and video_view.created_at
+
+Revision ID: 5b1e9f0c3a7d
+Revises: 13d628ad33cc
+Create Date: 2026-10-17 15:12:48.204417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e9f0c3a7d'
+down_revision = '13d628ad33cc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('video_view_sketch',
+        sa.Column('video_id', sa.String(length=32), nullable=False),
+        sa.Column('registers', sa.LargeBinary(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['video_id'], ['video.video_id'], ),
+        sa.PrimaryKeyConstraint('video_id')
+    )
+    # Existing views get no timestamp and count as outside the exact window
+    op.add_column('video_view', sa.Column('created_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_video_view_created_at'), 'video_view', ['created_at'])
+
+
+def downgrade():
+    op.drop_index(op.f('ix_video_view_created_at'), table_name='video_view')
+    op.drop_column('video_view', 'created_at')
+    op.drop_table('video_view_sketch')
@@ -0,0 +1,27 @@
+"""index the trending sort's tiebreaker
+
+Revision ID: 6d2f8a4c0e53
+Revises: b58d0e3f6a27
+Create Date: 2026-10-17 22:30:51.204417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d2f8a4c0e53'
+down_revision = 'b58d0e3f6a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Replaces the single column score index, which it covers
+    op.drop_index('ix_video_score_score', table_name='video_score')
+    op.create_index('ix_video_score_score_video_id', 'video_score', ['score', 'video_id'])
+
+
+def downgrade():
+    op.drop_index('ix_video_score_score_video_id', table_name='video_score')
+    op.create_index('ix_video_score_score', 'video_score', ['score'])
@@ -0,0 +1,32 @@
+"""add directory_state for incremental scans
+
+Revision ID: 72fbbda0f74b
+Revises: d0f609fa6765
+Create Date: 2026-10-17 13:22:47.904113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '72fbbda0f74b'
+down_revision = 'd0f609fa6765'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('directory_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('path', sa.String(length=2048), nullable=False),
+    sa.Column('mtime_ns', sa.BigInteger(), nullable=True),
+    sa.Column('files', sa.Text(), nullable=False, server_default='[]'),
+    sa.Column('subdirs', sa.Text(), nullable=False, server_default='[]'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('path')
+    )
+
+
+def downgrade():
+    op.drop_table('directory_state')
@@ -0,0 +1,83 @@
+"""add typed codec columns to video_info
+
+Revision ID: 8697d3d5176b
+Revises: 4482507abf6b
+Create Date: 2026-10-17 10:03:27.118604
+
+"""
+import json
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import table, column
+
+
+# revision identifiers, used by Alembic.
+revision = '8697d3d5176b'
+down_revision = '4482507abf6b'
+branch_labels = None
+depends_on = None
+
+
+def _frame_rate(rate):
+    try:
+        frn, frd = str(rate).split("/")
+        return float(frn) / float(frd) if float(frd) else None
+    except (ValueError, TypeError):
+        return None
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def upgrade():
+    op.add_column('video_info', sa.Column('framerate', sa.Float(), nullable=True))
+    op.add_column('video_info', sa.Column('video_codec', sa.String(length=32), nullable=True))
+    op.add_column('video_info', sa.Column('audio_codec', sa.String(length=32), nullable=True))
+    op.add_column('video_info', sa.Column('bitrate', sa.Integer(), nullable=True))
+    op.add_column('video_info', sa.Column('pixel_format', sa.String(length=32), nullable=True))
+    op.add_column('video_info', sa.Column('has_audio', sa.Boolean(), nullable=True))
+
+    # Backfill the new columns from the stored ffprobe output
+    video_info = table('video_info',
+        column('id', sa.Integer),
+        column('info', sa.Text),
+        column('framerate', sa.Float),
+        column('video_codec', sa.String),
+        column('audio_codec', sa.String),
+        column('bitrate', sa.Integer),
+        column('pixel_format', sa.String),
+        column('has_audio', sa.Boolean)
+    )
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(video_info.c.id, video_info.c.info).where(video_info.c.info != None)).fetchall()
+    for row_id, info in rows:
+        try:
+            streams = json.loads(info)
+        except ValueError:
+            print(f"Note: Could not parse metadata for video_info {row_id}")
+            continue
+        vcodec = next((i for i in streams if i.get('codec_type') == 'video'), None)
+        acodec = next((i for i in streams if i.get('codec_type') == 'audio'), None)
+        if vcodec is None:
+            continue
+        conn.execute(video_info.update().where(video_info.c.id == row_id).values(
+            framerate=_frame_rate(vcodec.get('r_frame_rate')),
+            video_codec=vcodec.get('codec_name'),
+            audio_codec=acodec.get('codec_name') if acodec else None,
+            bitrate=_int_or_none(vcodec.get('bit_rate')),
+            pixel_format=vcodec.get('pix_fmt'),
+            has_audio=acodec is not None
+        ))
+
+
+def downgrade():
+    op.drop_column('video_info', 'has_audio')
+    op.drop_column('video_info', 'pixel_format')
+    op.drop_column('video_info', 'bitrate')
+    op.drop_column('video_info', 'audio_codec')
+    op.drop_column('video_info', 'video_codec')
+    op.drop_column('video_info', 'framerate')
@@ -0,0 +1,36 @@
+"""add video_score for the trending sort
+
+Revision ID: 9f3d7b2e6c14
+Revises: e2c4a81d97b6
+Create Date: 2026-10-17 17:58:36.092151
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f3d7b2e6c14'
+down_revision = 'e2c4a81d97b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('video_score',
+        sa.Column('video_id', sa.String(length=32), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('computed_through', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['video_id'], ['video.video_id'], ),
+        sa.PrimaryKeyConstraint('video_id')
+    )
+    op.create_index(op.f('ix_video_score_score'), 'video_score', ['score'])
+    # Lets a listing start from video_score and look up the info per video,
+    # instead of scanning video_info
+    op.create_index(op.f('ix_video_info_video_id'), 'video_info', ['video_id'])
+
+
+def downgrade():
+    op.drop_index(op.f('ix_video_info_video_id'), table_name='video_info')
+    op.drop_index(op.f('ix_video_score_score'), table_name='video_score')
+    op.drop_table('video_score')
@@ -0,0 +1,39 @@
+"""store shuffle orders one row per position
+
+Revision ID: b58d0e3f6a27
+Revises: 4e7a2c9d1b36
+Create Date: 2026-10-17 21:48:03.552190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b58d0e3f6a27'
+down_revision = '4e7a2c9d1b36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Sessions only live for a day, existing ones are dropped rather than converted
+    op.execute('DELETE FROM shuffle_session')
+    op.create_table('shuffle_session_item',
+        sa.Column('session_id', sa.String(length=32), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('video_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['session_id'], ['shuffle_session.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('session_id', 'position')
+    )
+    with op.batch_alter_table('shuffle_session', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.drop_column('video_ids')
+
+
+def downgrade():
+    op.drop_table('shuffle_session_item')
+    op.execute('DELETE FROM shuffle_session')
+    with op.batch_alter_table('shuffle_session', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('video_ids', sa.Text(), nullable=False, server_default='[]'))
+        batch_op.drop_column('total')
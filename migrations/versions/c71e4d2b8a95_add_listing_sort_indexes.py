@@ -0,0 +1,33 @@
+"""add composite indexes for the listing sorts
+
+Revision ID: c71e4d2b8a95
+Revises: 3a8c5e1f7d20
+Create Date: 2026-10-17 20:34:17.915862
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71e4d2b8a95'
+down_revision = '3a8c5e1f7d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_video_updated_at_id', 'video', ['updated_at', 'id'])
+    op.create_index('ix_video_created_at_id', 'video', ['created_at', 'id'])
+    # Replaces the single column title index, which it covers
+    op.drop_index('ix_video_info_title', table_name='video_info')
+    op.create_index('ix_video_info_title_video_id', 'video_info', ['title', 'video_id'])
+    op.create_index('ix_video_info_duration_video_id', 'video_info', ['duration', 'video_id'])
+
+
+def downgrade():
+    op.drop_index('ix_video_info_duration_video_id', table_name='video_info')
+    op.drop_index('ix_video_info_title_video_id', table_name='video_info')
+    op.create_index('ix_video_info_title', 'video_info', ['title'])
+    op.drop_index('ix_video_created_at_id', table_name='video')
+    op.drop_index('ix_video_updated_at_id', table_name='video')
@@ -0,0 +1,43 @@
+"""make video_processing_job a durable queue
+
+Revision ID: ca8635f05f62
+Revises: 8697d3d5176b
+Create Date: 2026-10-17 11:20:54.370912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ca8635f05f62'
+down_revision = '8697d3d5176b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('video_processing_job', sa.Column('game_name', sa.String(length=100), nullable=True))
+    op.add_column('video_processing_job', sa.Column('tags', sa.Text(), nullable=True))
+    op.add_column('video_processing_job', sa.Column('attempts', sa.Integer(), nullable=True, server_default='0'))
+    op.add_column('video_processing_job', sa.Column('claim_token', sa.String(length=64), nullable=True))
+    op.add_column('video_processing_job', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_video_processing_job_claim_token'), 'video_processing_job', ['claim_token'])
+    op.create_index('ix_video_processing_job_status_id', 'video_processing_job', ['status', 'id'])
+    # SQLite can only add a foreign key by rebuilding the table
+    with op.batch_alter_table('video_processing_job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('owner_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_video_processing_job_owner_id_user', 'user', ['owner_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('video_processing_job', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_video_processing_job_owner_id_user', type_='foreignkey')
+        batch_op.drop_column('owner_id')
+    op.drop_index('ix_video_processing_job_status_id', table_name='video_processing_job')
+    op.drop_index(op.f('ix_video_processing_job_claim_token'), table_name='video_processing_job')
+    op.drop_column('video_processing_job', 'claimed_at')
+    op.drop_column('video_processing_job', 'claim_token')
+    op.drop_column('video_processing_job', 'attempts')
+    op.drop_column('video_processing_job', 'tags')
+    op.drop_column('video_processing_job', 'game_name')
@@ -0,0 +1,35 @@
+"""add file_identity cache
+
+Revision ID: d0f609fa6765
+Revises: ca8635f05f62
+Create Date: 2026-10-17 12:41:08.521377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd0f609fa6765'
+down_revision = 'ca8635f05f62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('file_identity',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('path', sa.String(length=2048), nullable=False),
+    sa.Column('device', sa.BigInteger(), nullable=False),
+    sa.Column('inode', sa.BigInteger(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('mtime_ns', sa.BigInteger(), nullable=False),
+    sa.Column('video_id', sa.String(length=32), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('path')
+    )
+
+
+def downgrade():
+    op.drop_table('file_identity')
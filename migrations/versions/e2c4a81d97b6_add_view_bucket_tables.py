@@ -0,0 +1,33 @@
+"""add hourly and daily view bucket tables
+
+Revision ID: e2c4a81d97b6
+Revises: 5b1e9f0c3a7d
+Create Date: 2026-10-17 16:40:09.518733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2c4a81d97b6'
+down_revision = '5b1e9f0c3a7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for name in ('video_view_hourly', 'video_view_daily'):
+        op.create_table(name,
+            sa.Column('video_id', sa.String(length=32), nullable=False),
+            sa.Column('bucket', sa.DateTime(), nullable=False),
+            sa.Column('views', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('video_id', 'bucket')
+        )
+        op.create_index(f'ix_{name}_bucket_video_id', name, ['bucket', 'video_id'])
+
+
+def downgrade():
+    for name in ('video_view_daily', 'video_view_hourly'):
+        op.drop_index(f'ix_{name}_bucket_video_id', table_name=name)
+        op.drop_table(name)
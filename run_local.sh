@@ -7,4 +7,5 @@ python3 -m pip install -r app/server/requirements.txt
 cd app/server && python3 setup.py install && cd ../..
 
 python3 -m flask db upgrade --directory=migrations
+fireshare worker &
 python3 -m flask run --with-threads
\ No newline at end of file